@@ -1,13 +1,24 @@
 from config import raw_china_target_list as raw_target_list
-from utility import get_data, TOSQL, create_engine
+from config import INDICATOR_CHECKPOINT_DB
+from price_store import open_price_store
+from streaming_indicators import IndicatorCheckpoints
+from utility import refresh_prices
 
 target_list = []
 
 for ticker, score in raw_target_list:
     target_list.append(ticker)
 
-China = get_data(target_list)
+store = open_price_store()
+checkpoints = IndicatorCheckpoints(INDICATOR_CHECKPOINT_DB)
 
-ChinaEngine = create_engine("CHINA")
-
-TOSQL(China, ChinaEngine)
+# only bars newer than what the store holds are downloaded, new symbols get their full history,
+# and the indicators resume from their checkpoints over those new bars
+report = refresh_prices(target_list, store, checkpoints=checkpoints)
+print(
+    f"appended {report['appended_rows']} bars, new: {report['new']}, "
+    f"restated: {report['restated']}, failed: {report['failed']}"
+)
+print(report["indicators"].to_string())
+checkpoints.close()
+store.close()
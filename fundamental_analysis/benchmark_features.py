@@ -0,0 +1,82 @@
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import talib as tb
+
+from benchmark_storage import synthetic_bars
+from indicators import indicators_frame
+from lag_features import design_matrix
+
+"""
+Peak memory and time of the Data.preprocessing design matrix on a long synthetic history:
+    concat : one shifted copy of the OHLCV slice per lag, then pd.concat for the lags, X and Xy
+    views  : lag_features.design_matrix, lags as strided views copied once into X / Xy
+
+python benchmark_features.py [n_days] [seq_length]
+The hand written indicators are first checked against talib on histories too short for their windows.
+"""
+
+COLUMNS = ["Open", "Close", "High", "Low", "Volume"]
+
+
+def concat_design_matrix(daily_data, ta, y, seq_length):
+    X_shift = [daily_data[COLUMNS]]
+    for i in range(1, seq_length):
+        X_shift.append(daily_data[COLUMNS].shift(i))
+    ohlc = pd.concat(X_shift, axis=1)
+    ohlc.columns = sum(
+        [[c + "T-{}".format(i) for c in COLUMNS] for i in range(seq_length)], []
+    )
+    X = pd.concat([ohlc, ta], axis=1)
+    Xy = pd.concat([X, y], axis=1)
+    return X, Xy
+
+
+def check_short_histories(max_days=40):
+    """ADXR, ATR and MA60 of indicators.py match talib, all NaN included, on 1 to `max_days` bars."""
+    for n_days in range(1, max_days + 1):
+        bars = synthetic_bars(n_days, 0)
+        high, low, close = (
+            bars[c].values.astype(float) for c in ["High", "Low", "Close"]
+        )
+        ta = indicators_frame(bars)
+        expected = {
+            "ADXR": tb.ADXR(high, low, close, timeperiod=14),
+            "ATR": tb.ATR(high, low, close, timeperiod=14),
+            "MA60": tb.MA(close, timeperiod=60),
+        }
+        for name, values in expected.items():
+            assert np.allclose(ta[name].values, values, equal_nan=True), (name, n_days)
+
+
+def measure(label, build):
+    tracemalloc.start()
+    started = time.perf_counter()
+    X, Xy = build()
+    seconds = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<8} {seconds:8.3f}s  peak {peak / 1024**2:9.1f} MiB  X {X.shape}")
+    return X
+
+
+def main(n_days=60000, seq_length=20):
+    check_short_histories()
+    daily_data = synthetic_bars(n_days, 0)
+    ta = indicators_frame(daily_data)
+    y = (daily_data["Close"].pct_change() > 0).astype(int).rename("Returns")
+
+    print(f"{n_days} days, seq_length {seq_length}")
+    a = measure("concat", lambda: concat_design_matrix(daily_data, ta, y, seq_length))
+    b = measure(
+        "views",
+        lambda: design_matrix(daily_data, COLUMNS, seq_length, blocks=[ta], label=y),
+    )
+    assert np.allclose(a.values, b.values, equal_nan=True)
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
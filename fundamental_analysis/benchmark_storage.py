@@ -0,0 +1,105 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from price_store import ParquetPriceStore, PriceStore
+
+"""
+Load time of the bars of every symbol through each storage path, on synthetic data:
+    legacy  : one table per symbol, select * through pd.read_sql (the original run_forest.Data path)
+    sqlite  : PriceStore bars table
+    parquet : ParquetPriceStore
+
+python benchmark_storage.py [n_symbols] [n_days]
+"""
+
+COLUMNS = ["Close", "High", "Low", "Open", "Volume"]
+
+
+def synthetic_bars(n_days, seed):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, n_days)))
+    return pd.DataFrame(
+        {
+            "Date": pd.bdate_range(end="2024-12-31", periods=n_days),
+            "Close": close,
+            "High": close * 1.01,
+            "Low": close * 0.99,
+            "Open": close,
+            "Volume": rng.integers(1e5, 1e7, n_days).astype(float),
+        }
+    )
+
+
+def timed(label, load, symbols):
+    started = time.perf_counter()
+    n_rows = sum(len(load(symbol)) for symbol in symbols)
+    seconds = time.perf_counter() - started
+    print(
+        f"{label:<28} {seconds:8.3f}s  {1000 * seconds / len(symbols):7.2f} ms/symbol  {n_rows} rows"
+    )
+
+
+def main(n_symbols=64, n_days=6000):
+    symbols = [f"{i:06d}.SZ" for i in range(n_symbols)]
+    start, end = pd.Timestamp("2020-12-23"), pd.Timestamp("2024-12-23")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = sqlite3.connect(os.path.join(tmp, "LEGACY.db"))
+        sqlite_store = PriceStore(os.path.join(tmp, "PRICES.db"))
+        parquet_store = ParquetPriceStore(os.path.join(tmp, "prices"))
+        for i, symbol in enumerate(symbols):
+            bars = synthetic_bars(n_days, i)
+            bars.to_sql(symbol, legacy, index=False)
+            sqlite_store.write(symbol, bars)
+            parquet_store.write(symbol, bars)
+
+        print(f"{n_symbols} symbols x {n_days} days")
+        timed(
+            "legacy select *",
+            lambda symbol: pd.read_sql(f"select * from '{symbol}'", legacy),
+            symbols,
+        )
+        timed(
+            "sqlite full history",
+            lambda s: sqlite_store.read(s, columns=COLUMNS),
+            symbols,
+        )
+        timed(
+            "parquet full history",
+            lambda s: parquet_store.read(s, columns=COLUMNS),
+            symbols,
+        )
+        timed(
+            "sqlite START..END",
+            lambda s: sqlite_store.read(s, start, end, columns=COLUMNS),
+            symbols,
+        )
+        timed(
+            "parquet START..END",
+            lambda s: parquet_store.read(s, start, end, columns=COLUMNS),
+            symbols,
+        )
+
+        started = time.perf_counter()
+        n = len(sqlite_store.read_slice(start, end, columns=["Close"]))
+        print(
+            f"{'sqlite universe slice':<28} {time.perf_counter() - started:8.3f}s  {n} rows"
+        )
+        started = time.perf_counter()
+        n = len(parquet_store.read_slice(start, end, columns=["Close"]))
+        print(
+            f"{'parquet universe slice':<28} {time.perf_counter() - started:8.3f}s  {n} rows"
+        )
+
+        legacy.close()
+        sqlite_store.close()
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
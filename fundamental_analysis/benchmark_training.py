@@ -0,0 +1,106 @@
+import multiprocessing
+import resource
+import sys
+import time
+
+import numpy as np
+
+"""
+Wall time and peak RSS of the XGB_training depth search on synthetic features, each run in its own process:
+    before : a new DMatrix per depth, xgboost.cv on it, then XGBClassifier.fit on the raw arrays
+    after  : HyperparameterSearch, data quantized once for the cv folds and the refit (hist)
+    chunks : same as after, the quantized matrices built from batches of 10000 rows
+
+Depths run from 1 to max_depth: depth 0 grows unlimited trees, whose histograms dominate the memory
+of both paths alike.
+
+python benchmark_training.py [n_rows] [n_features] [max_depth]
+"""
+
+BASE_PARAMS = dict(
+    learning_rate=0.3,
+    n_estimators=1000,
+    min_child_weight=1,
+    gamma=1,
+    subsample=1,
+    colsample_bytree=0.1,
+    reg_lambda=0,
+    reg_alpha=1,
+    random_state=42,
+)
+
+
+def synthetic(n_rows, n_features):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(n_rows, n_features))
+    y = (X[:, 0] + X[:, 1] * X[:, 2] + rng.normal(0, 1, n_rows) > 0).astype(int)
+    split = int(0.8 * n_rows)
+    return X[:split], y[:split], X[split:], y[split:]
+
+
+def before(n_rows, n_features, max_depth):
+    import xgboost
+    from xgboost import XGBClassifier
+
+    Xtrain, ytrain, Xtest, ytest = synthetic(n_rows, n_features)
+    for md in range(1, max_depth + 1):
+        model = XGBClassifier(max_depth=md, **BASE_PARAMS)
+        xgtrain = xgboost.DMatrix(Xtrain, label=ytrain)
+        cvresult = xgboost.cv(
+            model.get_xgb_params(),
+            xgtrain,
+            num_boost_round=1000,
+            early_stopping_rounds=50,
+            nfold=8,
+            metrics="auc",
+            stratified=True,
+            shuffle=True,
+            seed=42,
+        )
+        model.set_params(n_estimators=cvresult.shape[0])
+        model.fit(
+            Xtrain, ytrain, eval_set=[(Xtrain, ytrain), (Xtest, ytest)], verbose=False
+        )
+
+
+def after(n_rows, n_features, max_depth, chunk_rows=None):
+    from hyperparameter_search import HyperparameterSearch
+
+    Xtrain, ytrain, Xtest, ytest = synthetic(n_rows, n_features)
+    params = dict(BASE_PARAMS)
+    space = {"max_depth": list(range(1, max_depth + 1))}
+    search = HyperparameterSearch(params, space, chunk_rows=chunk_rows)
+    for result in search.run(Xtrain, ytrain):
+        search.fit(result.params, result.n_trees, Xtest, ytest)
+
+
+def measure(target, args, queue):
+    started = time.perf_counter()
+    target(*args)
+    seconds = time.perf_counter() - started
+    # kilobytes on linux
+    queue.put((seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+def run(label, target, args):
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=measure, args=(target, args, queue))
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        print(f"{label:<8} failed with exit code {process.exitcode}")
+        return
+    seconds, peak = queue.get()
+    print(f"{label:<8} {seconds:8.2f}s  peak RSS {peak:8.1f} MiB")
+
+
+def main(n_rows=50000, n_features=33, max_depth=10):
+    print(f"{n_rows} rows x {n_features} features, max_depth 1..{max_depth}")
+    run("before", before, (n_rows, n_features, max_depth))
+    run("after", after, (n_rows, n_features, max_depth))
+    run("chunks", after, (n_rows, n_features, max_depth, 10000))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -138,3 +138,126 @@ raw_us_target_list = [
     ("IT", 6),
     ("KMB", 6),
 ]
+
+# --------------------------------------- UNIVERSE SCAN -------------------------------------------
+# Yahoo starts answering with 429 well below 5 requests per second from a single IP
+SCAN_RATE_PER_SECOND = 2.0
+SCAN_BURST = 5
+SCAN_MAX_WORKERS = 8
+SCAN_EXCHANGE_LIMITS = {"SZ": 4, "SS": 4, "HK": 4, "US": 4}
+SCAN_RETRIES = 3
+SCAN_BACKOFF_SECONDS = 1.0
+
+# --------------------------------------- FUNDAMENTALS CACHE -------------------------------------------
+FUNDAMENTALS_DB = "FUNDAMENTALS.db"
+FUNDAMENTALS_TTL_DAYS = 90
+# annual reports land within about four months of the fiscal year end
+FUNDAMENTALS_FILING_LAG_DAYS = 120
+FUNDAMENTALS_RECHECK_DAYS = 7
+
+# --------------------------------------- UNIVERSE INDEX -------------------------------------------
+UNIVERSE_DB = "UNIVERSE.db"
+# dead and delisted codes are probed again in the background after this many days
+UNIVERSE_REPROBE_DAYS = 30
+UNIVERSE_REPROBE_RATE = 0.2
+
+# --------------------------------------- FILTER JOBS -------------------------------------------
+JOBS_DB = "JOBS.db"
+# shard processes of the filter screen, they share the SCAN_RATE_PER_SECOND, SCAN_BURST and SCAN_EXCHANGE_LIMITS budgets
+FILTER_WORKERS = 4
+
+# --------------------------------------- PRICES -------------------------------------------
+# daily bars of every symbol, see price_store.py (python price_store.py CHINA.db migrates old files)
+PRICE_DB = "CHINA.db"
+# "sqlite" keeps the bars in PRICE_DB, "parquet" in one memory-mapped parquet file per symbol under PRICE_PARQUET_DIR
+PRICE_BACKEND = "sqlite"
+PRICE_PARQUET_DIR = "prices"
+# indicator state of every symbol, advanced over the new bars by each price refresh (see streaming_indicators.py)
+INDICATOR_CHECKPOINT_DB = "INDICATORS.db"
+
+# --------------------------------------- FEATURE CACHE -------------------------------------------
+# feature matrices of run_forest.Data keyed by the hash of their bars and feature spec, see feature_cache.py
+FEATURE_CACHE_DIR = "features"
+FEATURE_CACHE_MAX_BYTES = 512 * 1024**2
+
+# --------------------------------------- TRAINING -------------------------------------------
+# run_forest.main trains tickers in this many processes, see training_driver.py
+TRAIN_WORKERS = 4
+# XGBoost / LightGBM threads of each worker, None splits the cores evenly between the workers
+TRAIN_THREADS_PER_WORKER = None
+# one row per ticker, appended as soon as the ticker is done
+TRAIN_SUMMARY = "training_summary.csv"
+
+# --------------------------------------- XGBOOST SEARCH -------------------------------------------
+# candidates of run_forest.XGB_training are every combination of these XGBClassifier parameters
+XGB_SEARCH_SPACE = {
+    "max_depth": [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10],
+    "learning_rate": [0.3],
+    "colsample_bytree": [0.1],
+    "reg_lambda": [0],
+    "reg_alpha": [1],
+}
+# candidates cross-validated at the same time, they share the XGBoost threads of the ticker
+XGB_SEARCH_WORKERS = 4
+# successive halving keeps the best 1 / eta of the candidates at each rung, None cross-validates all of them fully
+XGB_HALVING_ETA = None
+# training data is quantized once into XGB_MAX_BIN histogram bins per feature and shared by the cv folds and the refit
+XGB_MAX_BIN = 256
+# very long histories: build the quantized matrices XGB_CHUNK_ROWS rows at a time, and keep them on disk
+# with XGB_EXTERNAL_MEMORY (needs XGB_CHUNK_ROWS)
+XGB_CHUNK_ROWS = None
+XGB_EXTERNAL_MEMORY = False
+
+# --------------------------------------- FEATURE SELECTION -------------------------------------------
+# LightGBM fits of FeatureSelector.identify_zero_importance trained at the same time
+FS_IMPORTANCE_WORKERS = 2
+# stop averaging importances once their ranks correlate above this between batches, None always runs every fit
+FS_RANK_TOLERANCE = 0.99
+
+# --------------------------------------- SELECTION PLANS -------------------------------------------
+# feature selection of run_forest.Data is saved here and reused by retrains, see selection_plan.py
+SELECTION_PLAN_DIR = "selection_plans"
+# "ticker": every ticker has its own plan, "exchange": tickers of the same exchange pool one
+# (the features selected on one of them are used for all of them)
+SELECTION_PLAN_SCOPE = "ticker"
+# ticker -> group name (e.g. its sector), tickers of a group share one plan whatever the scope
+SELECTION_PLAN_GROUPS = {}
+# median population stability index of a ticker's features, against its own fingerprint, above which a plan is made again
+SELECTION_DRIFT_THRESHOLD = 0.25
+
+# --------------------------------------- WALK FORWARD -------------------------------------------
+# walk_forward.py backtest: "expanding" trains on every bar so far, "rolling" on the last WF_TRAIN_BARS
+WF_WINDOW = "expanding"
+WF_TRAIN_BARS = 500
+WF_TEST_BARS = 63
+# bars dropped between the training and test windows: the label horizon, then an embargo
+WF_PURGE_BARS = 1
+WF_EMBARGO_BARS = 5
+# cost of trading one unit of position, in basis points
+WF_COST_BPS = 10
+# long when the predicted probability of an up day is above the first, short below the second (None: flat)
+WF_LONG_THRESHOLD = 0.5
+WF_SHORT_THRESHOLD = None
+# XGBClassifier of every fold, fixed so the whole list runs in minutes
+WF_XGB_PARAMS = {
+    "n_estimators": 200,
+    "max_depth": 3,
+    "learning_rate": 0.05,
+    "colsample_bytree": 0.5,
+    "subsample": 0.8,
+    "random_state": 42,
+}
+# tickers backtested in separate processes, folds of a ticker trained at the same time
+WF_WORKERS = 4
+WF_FOLD_WORKERS = 2
+WF_SUMMARY = "walk_forward_summary.csv"
+
+# --------------------------------------- POOLED TRAINING -------------------------------------------
+# pooled_training.py trains one model on the rows of every ticker
+# fraction of the most recent dates held out as the test set of every ticker
+POOLED_TEST_SIZE = 0.2
+POOLED_NFOLD = 5
+# pooled data is large, successive halving drops the weak depths early
+POOLED_HALVING_ETA = 3
+POOLED_MODEL = "pooled_model.json"
+POOLED_SUMMARY = "pooled_summary.csv"
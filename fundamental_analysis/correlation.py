@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+
+"""
+Pearson correlations between the columns of a feature matrix, computed block by block.
+
+The columns are standardized once into a float32 array (missing values set to 0, with a mask of the
+present ones), then correlations are computed for one (block_size x block_size) tile at a time, so a
+full (features x features) matrix is never built. Like DataFrame.corr, each pair only uses the rows where
+both columns are present. Tiles only cover the upper triangle, and the pairs above a threshold are read
+off each tile with np.nonzero.
+"""
+
+DEFAULT_BLOCK_SIZE = 512
+
+
+class StandardizedColumns:
+    """
+    float32 columns of `values` centred on their mean and scaled by their (population) standard deviation.
+
+    Parameters
+    --------
+        values : array
+            (rows, columns) float array, NaN where missing
+    """
+
+    def __init__(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        present = ~np.isnan(values)
+        count = present.sum(axis=0)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.nansum(values, axis=0) / count
+            centred = np.where(present, values - mean, 0.0)
+            scale = np.sqrt((centred**2).sum(axis=0) / count)
+            scale[scale == 0] = np.nan
+            self.z = (centred / scale).astype(np.float32)
+        self.z[:, np.isnan(scale)] = 0
+        # constant and empty columns correlate with nothing
+        self.valid = ~np.isnan(scale)
+        self.n_rows, self.n_columns = values.shape
+        self.complete = present.all(axis=0)
+        self.mask = None if self.complete.all() else present.astype(np.float32)
+
+    def block(self, rows, cols):
+        """Correlations between the columns `rows` and the columns `cols` (two slices)."""
+        za, zb = self.z[:, rows], self.z[:, cols]
+        if self.complete[rows].all() and self.complete[cols].all():
+            corr = (za.T @ zb) / np.float32(self.n_rows)
+        else:
+            ma, mb = self.mask[:, rows], self.mask[:, cols]
+            n = ma.T @ mb
+            sa, sb = za.T @ mb, ma.T @ zb
+            with np.errstate(invalid="ignore", divide="ignore"):
+                cov = za.T @ zb - sa * sb / n
+                var_a = (za * za).T @ mb - sa * sa / n
+                var_b = ma.T @ (zb * zb) - sb * sb / n
+                corr = cov / np.sqrt(var_a * var_b)
+            corr[n < 2] = np.nan
+        corr[~self.valid[rows], :] = np.nan
+        corr[:, ~self.valid[cols]] = np.nan
+        return np.clip(corr, -1, 1, out=corr)
+
+
+def correlated_pairs(values, threshold, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Pairs of columns (i < j) with an absolute correlation above `threshold`.
+
+    Returns the i, j and correlation arrays, sorted by j then i.
+    """
+    columns = StandardizedColumns(values)
+    n = columns.n_columns
+    found_i, found_j, found_corr = [], [], []
+    for start_a in range(0, n, block_size):
+        rows = slice(start_a, min(start_a + block_size, n))
+        for start_b in range(start_a, n, block_size):
+            cols = slice(start_b, min(start_b + block_size, n))
+            corr = columns.block(rows, cols)
+            above = np.abs(corr) > threshold
+            if start_a == start_b:
+                # the diagonal tile: only pairs above its diagonal
+                above &= np.triu(np.ones(above.shape, dtype=bool), k=1)
+            i, j = np.nonzero(above)
+            found_i.append(i + start_a)
+            found_j.append(j + start_b)
+            found_corr.append(corr[i, j])
+
+    i = np.concatenate(found_i) if found_i else np.empty(0, dtype=np.intp)
+    j = np.concatenate(found_j) if found_j else np.empty(0, dtype=np.intp)
+    corr = np.concatenate(found_corr) if found_corr else np.empty(0, dtype=np.float32)
+    order = np.lexsort((i, j))
+    return i[order], j[order], corr[order]
+
+
+def correlation_frame(data, index=None, columns=None):
+    """DataFrame of the correlations between the `index` and `columns` features of `data` (all by default)."""
+    index = list(data.columns) if index is None else list(index)
+    columns = list(data.columns) if columns is None else list(columns)
+    names = list(dict.fromkeys(index + columns))
+    position = {name: k for k, name in enumerate(names)}
+    standardized = StandardizedColumns(data[names].values)
+    corr = standardized.block(slice(None), slice(None))
+    rows = [position[name] for name in index]
+    cols = [position[name] for name in columns]
+    return pd.DataFrame(
+        corr[np.ix_(rows, cols)].astype(np.float64), index=index, columns=columns
+    )
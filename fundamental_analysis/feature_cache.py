@@ -0,0 +1,84 @@
+import hashlib
+import json
+import os
+from asyncio.log import logger
+
+import pandas as pd
+
+from config import FEATURE_CACHE_DIR, FEATURE_CACHE_MAX_BYTES
+
+"""
+Content addressed cache of feature matrices.
+
+The key of a matrix is the hash of the symbol, of the source bars it was built from and of the
+feature spec (a json-able dict naming everything that shapes the features), so a matrix is only
+rebuilt when the bars or the feature definitions change. Matrices are parquet files named after
+their key under `root`; reading one refreshes its modification time and the least recently used
+files are evicted once the cache grows over `max_bytes`.
+"""
+
+
+def feature_key(symbol, bars, spec):
+    digest = hashlib.sha256()
+    digest.update(symbol.encode())
+    digest.update(pd.util.hash_pandas_object(bars, index=True).values.tobytes())
+    digest.update(json.dumps(spec, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+class FeatureCache:
+
+    def __init__(self, root=FEATURE_CACHE_DIR, max_bytes=FEATURE_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, f"{key}.parquet")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            os.utime(path)
+            return pd.read_parquet(path, memory_map=True)
+        except FileNotFoundError:
+            # never stored, or evicted meanwhile by another process sharing the cache
+            return None
+
+    def put(self, key, frame):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        frame.to_parquet(tmp)
+        os.replace(tmp, path)
+        self.evict()
+
+    def get_or_build(self, symbol, bars, spec, build):
+        """The cached matrix of (symbol, bars, spec), built by `build()` and stored on a miss."""
+        key = feature_key(symbol, bars, spec)
+        frame = self.get(key)
+        if frame is not None:
+            logger.info(f"{symbol}: features read from cache {key[:12]}")
+            return frame
+        frame = build()
+        self.put(key, frame)
+        return frame
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.root):
+            if name.endswith(".parquet"):
+                try:
+                    stat = os.stat(os.path.join(self.root, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.root, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
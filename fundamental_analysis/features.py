@@ -0,0 +1,143 @@
+from asyncio.log import logger
+
+import numpy as np
+import pandas as pd
+
+from indicators import (
+    macd_panel,
+    rolling_mean,
+    rolling_std,
+    rsi_panel,
+    true_range_panel,
+    wilder_average,
+)
+
+"""
+Feature pipeline behind the utility.get_* helpers.
+
+Each feature is registered with @feature and computed from numpy arrays by a FeatureInputs, which
+caches what several features share (the adjusted close, its log, the Bollinger bands) and the
+features themselves, so features depending on each other (state on Return) or on the same bands
+(bb_low, bb_mid, bb_high) do the work once. compute_features only computes the requested features
+and adds them to the frame in one assignment.
+"""
+
+FEATURES = {}
+
+
+def feature(name):
+    def register(compute):
+        FEATURES[name] = compute
+        return compute
+
+    return register
+
+
+class FeatureInputs:
+
+    def __init__(self, df):
+        self.df = df
+        self._cache = {}
+
+    def cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def column(self, name):
+        return self.cached(("column", name), lambda: self.df[name].astype(float).values)
+
+    def feature(self, name):
+        return self.cached(("feature", name), lambda: FEATURES[name](self))
+
+    def log_bands(self, length=20, std=2.0):
+        """Bollinger bands (lower, mid, upper) of log1p of the adjusted close, as pandas_ta.bbands."""
+
+        def compute():
+            log_price = np.log1p(self.column("Adj Close"))[:, None]
+            mid = rolling_mean(log_price, length)[:, 0]
+            deviation = std * rolling_std(log_price, length)[:, 0]
+            return mid - deviation, mid, mid + deviation
+
+        return self.cached(("log_bands", length, std), compute)
+
+
+def zscore(x):
+    return (x - np.nanmean(x)) / np.nanstd(x, ddof=1)
+
+
+@feature("Return")
+def _return(x):
+    close = x.column("Adj Close")
+    change = np.full(len(close), np.nan)
+    change[1:] = close[1:] / close[:-1] - 1
+    return np.round(change, 4)
+
+
+@feature("state")
+def _state(x):
+    return np.where(x.feature("Return") > 0, "1", "0")
+
+
+@feature("garman_klass_vol")
+def _garman_klass_vol(x):
+    return ((np.log(x.column("High")) - np.log(x.column("Low"))) ** 2) / 2 - (
+        2 * np.log(2) - 1
+    ) * ((np.log(x.column("Adj Close")) - np.log(x.column("Open"))) ** 2)
+
+
+# pandas_ta hands rsi, atr and macd over to talib when it is installed, these follow talib
+@feature("rsi")
+def _rsi(x):
+    return rsi_panel(x.column("Adj Close")[:, None], 20)[:, 0]
+
+
+# the bands are taken on log prices and normalized by the adjusted close, as the original helpers did
+@feature("bb_low")
+def _bb_low(x):
+    return x.log_bands()[0] / x.column("Adj Close")
+
+
+@feature("bb_mid")
+def _bb_mid(x):
+    return x.log_bands()[1] / x.column("Adj Close")
+
+
+@feature("bb_high")
+def _bb_high(x):
+    return x.log_bands()[2] / x.column("Adj Close")
+
+
+@feature("atr")
+def _atr(x):
+    true_range = true_range_panel(
+        x.column("High")[:, None], x.column("Low")[:, None], x.column("Close")[:, None]
+    )[:, 0]
+    return zscore(wilder_average(true_range, 14))
+
+
+@feature("macd")
+def _macd(x):
+    return zscore(macd_panel(x.column("Adj Close")[:, None])[:, 0])
+
+
+@feature("dollar_volume")
+def _dollar_volume(x):
+    return x.column("Adj Close") * x.column("Volume") / 1e6
+
+
+def compute_features(df, names=None):
+    """
+    Adds the registered features `names` (all of them by default) to `df` and returns it.
+    Features are computed from the frame's columns at call time, so `df` is expected to hold
+    the columns they read (Open, High, Low, Close, Adj Close, Volume).
+    """
+    names = list(FEATURES) if names is None else list(names)
+    if df.empty:
+        logger.debug("The dataframe is empty. No transformations will be applied.")
+        return df
+    inputs = FeatureInputs(df)
+    values = {name: inputs.feature(name) for name in names}
+    df[names] = pd.DataFrame(values, index=df.index)
+    logger.info(f"Computed features: {', '.join(names)}")
+    return df
@@ -0,0 +1,208 @@
+import sqlite3
+import threading
+from asyncio.log import logger
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+"""
+On-disk cache of the yahoo financial statements used by Stock_Info.
+
+Statements are stored in long format, one row per (ticker, statement, fiscal period, line item),
+next to a fetch log holding when each statement was downloaded and the latest fiscal period it had.
+Annual reports only change once a year, so a cached statement is served until either
+    - it is older than `ttl_days`, or
+    - a new annual filing is likely out (latest period + 1 year + `filing_lag_days` has passed)
+      and the statement has not been re-checked for `recheck_days`.
+Empty statements are never stored: yahoo answers a throttled or failed request with an empty frame
+as well, and caching it would hide a listed company until the ttl runs out.
+"""
+
+
+class FundamentalsStore:
+
+    def __init__(self, path, ttl_days=90, filing_lag_days=120, recheck_days=7):
+        self.path = path
+        self.ttl = timedelta(days=ttl_days)
+        self.filing_lag = timedelta(days=filing_lag_days)
+        self.recheck = timedelta(days=recheck_days)
+
+        # the universe scan calls in from several threads, and the screen shards from several processes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS statements (
+                ticker TEXT NOT NULL,
+                statement TEXT NOT NULL,
+                period TEXT NOT NULL,
+                item TEXT NOT NULL,
+                value REAL,
+                PRIMARY KEY (ticker, statement, period, item)
+            );
+            CREATE TABLE IF NOT EXISTS fetch_log (
+                ticker TEXT NOT NULL,
+                statement TEXT NOT NULL,
+                fetched_at TEXT NOT NULL,
+                latest_period TEXT,
+                PRIMARY KEY (ticker, statement)
+            );
+            """
+        )
+
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        self._conn.close()
+
+    def needs_refresh(self, fetched_at, latest_period, now=None):
+        now = now or datetime.now()
+        age = now - fetched_at
+        if age > self.ttl:
+            return True
+        # an empty statement, only left by older versions of the store
+        if latest_period is None:
+            return True
+        next_filing = latest_period + timedelta(days=365) + self.filing_lag
+        return now >= next_filing and age > self.recheck
+
+    def _fetch_log(self, ticker, statement):
+        row = self._conn.execute(
+            "SELECT fetched_at, latest_period FROM fetch_log WHERE ticker = ? AND statement = ?",
+            (ticker, statement),
+        ).fetchone()
+        if row is None:
+            return None
+        fetched_at = datetime.fromisoformat(row[0])
+        latest_period = datetime.fromisoformat(row[1]) if row[1] else None
+        return fetched_at, latest_period
+
+    def get(self, ticker, statement, loader, force=False):
+        """
+        Return the statement as the yahoo shaped dataframe (line items as index, fiscal periods as
+        columns with the latest first). `loader` is only called when the cached copy is stale,
+        or always with `force`. An empty statement is returned without being cached.
+        """
+        with self._lock:
+            log = self._fetch_log(ticker, statement)
+        if not force and log is not None and not self.needs_refresh(*log):
+            self.hits += 1
+            return self._read(ticker, statement)
+
+        self.misses += 1
+        df = loader()
+        if df is not None and not df.empty:
+            self.put(ticker, statement, df)
+        return df
+
+    def get_series(self, ticker, statement, loader, force=False):
+        """Same as `get` for date indexed series such as the output of get_shares_full."""
+        with self._lock:
+            log = self._fetch_log(ticker, statement)
+        if not force and log is not None and not self.needs_refresh(*log):
+            self.hits += 1
+            df = self._read(ticker, statement)
+            if df.empty:
+                return None
+            return df.iloc[0].sort_index()
+
+        self.misses += 1
+        series = loader()
+        if series is not None and not series.empty:
+            # the share count history repeats dates when several filings land on the same day
+            deduplicated = series[~series.index.duplicated(keep="last")]
+            frame = pd.DataFrame([deduplicated.values], columns=deduplicated.index)
+            self.put(ticker, statement, frame)
+        return series
+
+    def put(self, ticker, statement, df):
+        rows = []
+        latest_period = None
+        if df is not None and not df.empty:
+            periods = pd.to_datetime(df.columns)
+            if periods.tz is not None:
+                periods = periods.tz_localize(None)
+            latest_period = periods.max().isoformat()
+            values = df.to_numpy(dtype=float, na_value=np.nan)
+            for j, period in enumerate(periods):
+                period = period.isoformat()
+                for i, item in enumerate(df.index):
+                    value = values[i, j]
+                    rows.append(
+                        (
+                            ticker,
+                            statement,
+                            period,
+                            str(item),
+                            None if np.isnan(value) else value,
+                        )
+                    )
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM statements WHERE ticker = ? AND statement = ?",
+                (ticker, statement),
+            )
+            self._conn.executemany(
+                "INSERT INTO statements VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fetch_log VALUES (?, ?, ?, ?)",
+                (ticker, statement, datetime.now().isoformat(), latest_period),
+            )
+
+    def _read(self, ticker, statement):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT item, period, value FROM statements WHERE ticker = ? AND statement = ?",
+                (ticker, statement),
+            ).fetchall()
+        if not rows:
+            return pd.DataFrame()
+        long = pd.DataFrame(rows, columns=["item", "period", "value"])
+        long["period"] = pd.to_datetime(long["period"])
+        df = long.pivot(index="item", columns="period", values="value").astype(float)
+        df = df.sort_index(axis=1, ascending=False)
+        df.index.name = None
+        df.columns.name = None
+        return df
+
+    def load_panel(self, tickers=None, statements=None):
+        """
+        Bulk read of the cache as a long dataframe with columns ticker, statement, period, item, value,
+        optionally restricted to some tickers and statements.
+        """
+        query = "SELECT ticker, statement, period, item, value FROM statements"
+        clauses, params = [], []
+        for column, values in (("ticker", tickers), ("statement", statements)):
+            if values is not None:
+                values = list(values)
+                clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params += values
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        with self._lock:
+            panel = pd.read_sql(query, self._conn, params=params)
+        panel["period"] = pd.to_datetime(panel["period"])
+        return panel
+
+    def evict(self, max_age_days):
+        """Drop every statement fetched more than `max_age_days` ago."""
+        cutoff = (datetime.now() - timedelta(days=max_age_days)).isoformat()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                DELETE FROM statements WHERE (ticker, statement) IN
+                    (SELECT ticker, statement FROM fetch_log WHERE fetched_at < ?)
+                """,
+                (cutoff,),
+            )
+            n = self._conn.execute(
+                "DELETE FROM fetch_log WHERE fetched_at < ?", (cutoff,)
+            ).rowcount
+        logger.info(f"evicted {n} cached statements older than {max_age_days} days")
+        return n
@@ -0,0 +1,393 @@
+import itertools
+import math
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import xgboost
+from sklearn.model_selection import StratifiedKFold
+from xgboost import XGBClassifier
+
+"""
+Cross-validated search over XGBClassifier parameters, used by run_forest.XGB_training.
+
+The training data is quantized once for the histogram tree method: one QuantileDMatrix for the whole
+training set and one per fold, all sharing the bin boundaries of the whole set. Every candidate, every
+rung and the final refit train on these same matrices. Candidates are evaluated concurrently by threads
+(XGBoost releases the GIL), each one with its share of the threads.
+With successive halving, every candidate is first cross-validated over a small number of boosting rounds,
+only the best 1 / eta of them go on to a budget eta times larger, and so on up to the full number of rounds.
+"""
+
+
+class ChunkIter(xgboost.DataIter):
+    """Feeds the `rows` of X / y to XGBoost `chunk_rows` at a time, instead of one concatenated array."""
+
+    def __init__(
+        self,
+        X,
+        y,
+        rows,
+        chunk_rows,
+        cache_prefix=None,
+        feature_types=None,
+        feature_names=None,
+    ):
+        self.X = X
+        self.y = y
+        self.feature_types = feature_types
+        self.feature_names = feature_names
+        self.chunks = [
+            rows[i : i + chunk_rows] for i in range(0, len(rows), chunk_rows)
+        ]
+        self._i = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self._i == len(self.chunks):
+            return False
+        chunk = self.chunks[self._i]
+        input_data(
+            data=self.X[chunk],
+            label=self.y[chunk],
+            feature_types=self.feature_types,
+            feature_names=self.feature_names,
+        )
+        self._i += 1
+        return True
+
+    def reset(self):
+        self._i = 0
+
+
+class QuantizedData:
+    """
+    Quantized training set and folds.
+
+    Parameters
+    --------
+        X, y : array
+            Training features and labels
+        folds : list
+            (train rows, test rows) pairs
+        max_bin : int
+            Histogram bins per feature
+        chunk_rows : int
+            When given, the matrices are built from ChunkIter batches of that many rows
+        external_memory : bool
+            Keep the quantized pages on disk (under `cache_dir`) rather than in memory, needs chunk_rows
+        feature_types : list
+            XGBoost type of every column, "c" marking categorical ones. None: all numerical
+        feature_names : list
+            Column names, kept by the trained boosters for their plots. None: f0, f1, ...
+    """
+
+    def __init__(
+        self,
+        X,
+        y,
+        folds,
+        max_bin=256,
+        chunk_rows=None,
+        external_memory=False,
+        cache_dir=None,
+        feature_types=None,
+        feature_names=None,
+    ):
+        self.X = X
+        self.y = y
+        self.max_bin = max_bin
+        self.chunk_rows = chunk_rows
+        self.external_memory = external_memory
+        self.feature_types = feature_types
+        self.feature_names = feature_names
+        # categorical columns hold integer codes
+        self.categorical = {}
+        if feature_types is not None:
+            self.categorical = dict(
+                feature_types=feature_types, enable_categorical=True
+            )
+        self.cache_dir = cache_dir or tempfile.mkdtemp(prefix="xgb-cache-")
+        self._n = 0
+        self.full = self.matrix(np.arange(len(y)))
+        self.folds = [
+            (self.matrix(train, ref=self.full), self.matrix(test, ref=self.full))
+            for train, test in folds
+        ]
+
+    def matrix(self, rows, ref=None, X=None, y=None):
+        X = self.X if X is None else X
+        y = self.y if y is None else y
+        if self.chunk_rows is None:
+            return xgboost.QuantileDMatrix(
+                X[rows],
+                label=y[rows],
+                max_bin=self.max_bin,
+                ref=ref,
+                feature_names=self.feature_names,
+                **self.categorical,
+            )
+        if not self.external_memory:
+            it = ChunkIter(
+                X,
+                y,
+                rows,
+                self.chunk_rows,
+                feature_types=self.feature_types,
+                feature_names=self.feature_names,
+            )
+            return xgboost.QuantileDMatrix(
+                it, max_bin=self.max_bin, ref=ref, **self.categorical
+            )
+        self._n += 1
+        cache_prefix = os.path.join(self.cache_dir, f"m{self._n}")
+        it = ChunkIter(
+            X,
+            y,
+            rows,
+            self.chunk_rows,
+            cache_prefix,
+            self.feature_types,
+            self.feature_names,
+        )
+        # XGBoost 3 pages quantized data, older versions only page the raw DMatrix
+        if hasattr(xgboost, "ExtMemQuantileDMatrix"):
+            return xgboost.ExtMemQuantileDMatrix(
+                it, max_bin=self.max_bin, ref=ref, **self.categorical
+            )
+        return xgboost.DMatrix(it, **self.categorical)
+
+    def test_matrix(self, X, y):
+        """A held out set quantized with the training bins."""
+        X, y = np.asarray(X), np.asarray(y).reshape(-1)
+        return self.matrix(np.arange(len(y)), ref=self.full, X=X, y=y)
+
+
+class SearchResult:
+
+    def __init__(self, params, n_trees, cv_mean, cv_std, rounds):
+        self.params = params
+        self.n_trees = n_trees
+        self.cv_mean = cv_mean
+        self.cv_std = cv_std
+        self.rounds = rounds
+
+    def __repr__(self):
+        return (
+            f"SearchResult({self.params}, trees={self.n_trees}, cv={self.cv_mean:.4f})"
+        )
+
+
+class HyperparameterSearch:
+    """
+    Parameters
+    --------
+        base_params : dict
+            XGBClassifier parameters shared by every candidate
+        space : dict
+            Parameter name -> list of values, every combination is a candidate
+        num_boost_round : int
+            Boosting rounds of the last rung (of the only rung without halving)
+        early_stopping_rounds : int
+            Rounds without improvement of the cv metric before a candidate stops boosting
+        nfold : int
+            Number of stratified folds
+        metric : str
+            cv metric, larger is better
+        seed : int
+            Seed of the folds
+        n_workers : int
+            Candidates cross-validated at the same time
+        n_jobs : int
+            Total XGBoost threads, split between the workers. None leaves it to XGBoost
+        eta : int
+            Successive halving factor, None cross-validates every candidate with the full budget
+        min_rounds : int
+            Boosting rounds of the first rung when halving
+        max_bin : int
+            Histogram bins per feature
+        chunk_rows : int
+            Build the quantized matrices from batches of that many rows (see QuantizedData)
+        external_memory : bool
+            Keep the quantized matrices on disk, for histories too long for memory.
+            Candidates are then cross-validated one at a time
+        feature_types : list
+            XGBoost type of every column, "c" for the categorical ones (see QuantizedData)
+    """
+
+    def __init__(
+        self,
+        base_params,
+        space,
+        num_boost_round=1000,
+        early_stopping_rounds=50,
+        nfold=8,
+        metric="auc",
+        seed=42,
+        n_workers=1,
+        n_jobs=None,
+        eta=None,
+        min_rounds=50,
+        max_bin=256,
+        chunk_rows=None,
+        external_memory=False,
+        feature_types=None,
+    ):
+        self.base_params = base_params
+        self.space = space
+        self.num_boost_round = num_boost_round
+        self.early_stopping_rounds = early_stopping_rounds
+        self.nfold = nfold
+        self.metric = metric
+        self.seed = seed
+        self.n_workers = max(1, n_workers)
+        self.n_jobs = n_jobs
+        self.eta = eta
+        self.min_rounds = min_rounds
+        self.max_bin = max_bin
+        self.chunk_rows = chunk_rows
+        self.external_memory = external_memory
+        self.feature_types = feature_types
+        self.data = None
+        # every rung, as lists of SearchResult
+        self.history = []
+
+    def candidates(self):
+        names = list(self.space)
+        return [
+            dict(zip(names, values))
+            for values in itertools.product(*[self.space[name] for name in names])
+        ]
+
+    def budgets(self):
+        if not self.eta:
+            return [self.num_boost_round]
+        budgets = []
+        rounds = self.min_rounds
+        while rounds < self.num_boost_round:
+            budgets.append(rounds)
+            rounds *= self.eta
+        return budgets + [self.num_boost_round]
+
+    def model(self, params, n_estimators=None):
+        """XGBClassifier of the base parameters updated with `params`."""
+        model_params = {"tree_method": "hist", **self.base_params, **params}
+        if n_estimators is not None:
+            model_params["n_estimators"] = n_estimators
+        if self.feature_types is not None:
+            model_params.update(
+                feature_types=self.feature_types, enable_categorical=True
+            )
+        return XGBClassifier(**model_params)
+
+    def _threads(self):
+        if self.n_jobs is None:
+            return None
+        return max(1, self.n_jobs // self.n_workers)
+
+    def evaluate(self, params, rounds):
+        """
+        Cross-validation of one candidate, as xgboost.cv with early stopping on the mean test score:
+        the fold boosters are grown round by round together, and the result is read at the best round.
+        """
+        xgb_param = self.model(params).get_xgb_params()
+        xgb_param["n_jobs"] = self._threads()
+        xgb_param["eval_metric"] = self.metric
+        xgb_param["max_bin"] = self.max_bin
+        boosters = [
+            xgboost.Booster(xgb_param, [train, test]) for train, test in self.data.folds
+        ]
+        best_mean, best_std, best_round = -np.inf, np.nan, 0
+        for i in range(rounds):
+            scores = []
+            for booster, (train, test) in zip(boosters, self.data.folds):
+                booster.update(train, i)
+                scores.append(
+                    float(booster.eval_set([(test, "test")], i).split(":")[-1])
+                )
+            mean = np.mean(scores)
+            if mean > best_mean:
+                best_mean, best_std, best_round = mean, np.std(scores), i
+            elif i - best_round >= self.early_stopping_rounds:
+                break
+        return SearchResult(params, best_round + 1, best_mean, best_std, rounds)
+
+    def fit(self, params, n_estimators, X_test, y_test):
+        """
+        XGBClassifier of `params` and `n_estimators` trees, trained on the shared quantized training set.
+        Its evals_result holds the logloss of the training (validation_0) and test (validation_1) sets.
+        """
+        model = self.model(params, n_estimators=n_estimators)
+        xgb_param = model.get_xgb_params()
+        xgb_param["eval_metric"] = "logloss"
+        xgb_param["max_bin"] = self.max_bin
+        evals_result = {}
+        booster = xgboost.train(
+            xgb_param,
+            self.data.full,
+            num_boost_round=n_estimators,
+            evals=[
+                (self.data.full, "validation_0"),
+                (self.data.test_matrix(X_test, y_test), "validation_1"),
+            ],
+            evals_result=evals_result,
+            verbose_eval=False,
+        )
+        model.load_model(bytearray(booster.save_raw("json")))
+        model.evals_result_ = evals_result
+        return model
+
+    def run(self, X, y, feature_names=None):
+        """
+        Results of the candidates which made it through the last rung, in candidate order.
+        The boosters fitted afterwards name their features `feature_names` (the columns of X when it
+        is a DataFrame).
+        """
+        if feature_names is None and hasattr(X, "columns"):
+            feature_names = [str(column) for column in X.columns]
+        X = np.asarray(X)
+        labels = np.asarray(y).reshape(-1)
+        folds = list(
+            StratifiedKFold(self.nfold, shuffle=True, random_state=self.seed).split(
+                np.zeros(len(labels)), labels
+            )
+        )
+        self.data = QuantizedData(
+            X,
+            labels,
+            folds,
+            max_bin=self.max_bin,
+            chunk_rows=self.chunk_rows,
+            external_memory=self.external_memory,
+            feature_types=self.feature_types,
+            feature_names=feature_names,
+        )
+
+        candidates = self.candidates()
+        budgets = self.budgets()
+        last = len(budgets) - 1
+        i = 0
+        # paged matrices can only be read by one booster at a time
+        n_workers = 1 if self.external_memory else self.n_workers
+        with ThreadPoolExecutor(n_workers) as executor:
+            while True:
+                rounds = budgets[i]
+                results = list(
+                    executor.map(
+                        lambda params: self.evaluate(params, rounds),
+                        candidates,
+                    )
+                )
+                self.history.append(results)
+                if i == last:
+                    break
+                keep = max(1, math.ceil(len(results) / self.eta))
+                ranked = sorted(
+                    range(len(results)), key=lambda j: results[j].cv_mean, reverse=True
+                )
+                # survivors keep their candidate order
+                candidates = [candidates[j] for j in sorted(ranked[:keep])]
+                # a single survivor goes straight to the full budget
+                i = last if len(candidates) == 1 else i + 1
+        return results
@@ -0,0 +1,358 @@
+import numpy as np
+import pandas as pd
+import talib as tb
+
+"""
+Declarative technical indicator engine.
+
+An indicator is a list of output column names and a function of the shared IndicatorInputs.
+Every indicator is computed once, multi-output talib calls (BBANDS) are unpacked from a single call,
+intermediates used by several indicators (running sums, true range, ADX) are computed once per
+series, and every output is written into one preallocated float64 matrix.
+"""
+
+
+class Indicator:
+
+    def __init__(self, outputs, compute):
+        self.outputs = list(outputs)
+        self.compute = compute
+
+
+class IndicatorInputs:
+    """OHLCV arrays plus a cache of the intermediates shared between indicators."""
+
+    def __init__(self, o, h, l, c, v):
+        self.series = {
+            "open": np.asarray(o, dtype=float),
+            "high": np.asarray(h, dtype=float),
+            "low": np.asarray(l, dtype=float),
+            "close": np.asarray(c, dtype=float),
+            "volume": np.asarray(v, dtype=float),
+        }
+        self.n = len(self.series["close"])
+        self._cache = {}
+
+    def __getitem__(self, name):
+        return self.series[name]
+
+    def cached(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute()
+        return self._cache[key]
+
+    def running_sum(self, name):
+        return self.cached(
+            ("running_sum", name),
+            lambda: np.concatenate([[0.0], np.cumsum(self[name])]),
+        )
+
+    def moving_average(self, name, period):
+        """Simple moving average from the shared running sum, same values as talib MA."""
+        total = self.running_sum(name)
+        ma = np.full(self.n, np.nan)
+        if self.n >= period:
+            ma[period - 1 :] = (total[period:] - total[:-period]) / period
+        return ma
+
+    def true_range(self):
+        def compute():
+            previous_close = np.concatenate([[np.nan], self["close"][:-1]])
+            return np.maximum(self["high"], previous_close) - np.minimum(
+                self["low"], previous_close
+            )
+
+        return self.cached("true_range", compute)
+
+    def adx(self, period):
+        return self.cached(
+            ("adx", period),
+            lambda: tb.ADX(self["high"], self["low"], self["close"], timeperiod=period),
+        )
+
+
+def wilder_average(values, period):
+    """Wilder smoothing seeded with the mean of the first `period` valid values, as talib ATR."""
+    return wilder_panel(values[:, None], period)[:, 0]
+
+
+def moving_averages(name, periods, prefix):
+    return Indicator(
+        [f"{prefix}{period}" for period in periods],
+        lambda x: [x.moving_average(name, period) for period in periods],
+    )
+
+
+def adx(period=14):
+    return Indicator(["ADX"], lambda x: [x.adx(period)])
+
+
+def adxr(period=14):
+    # ADXR is the mean of ADX and ADX period - 1 bars ago, no need for a second talib pass
+    def compute(x):
+        values = x.adx(period)
+        lagged = np.full(len(values), np.nan)
+        # histories of period - 1 bars or fewer have no lagged value, ADXR stays NaN as in talib
+        if len(values) > period - 1:
+            lagged[period - 1 :] = values[: len(values) - (period - 1)]
+        return [(values + lagged) / 2]
+
+    return Indicator(["ADXR"], compute)
+
+
+def macd(fast=12, slow=26, signal=9):
+    return Indicator(
+        ["MACD"],
+        lambda x: [
+            tb.MACD(x["close"], fastperiod=fast, slowperiod=slow, signalperiod=signal)[
+                0
+            ]
+        ],
+    )
+
+
+def rsi(period=14):
+    return Indicator(["RSI"], lambda x: [tb.RSI(x["close"], timeperiod=period)])
+
+
+def bbands(period=5, nbdev=2):
+    return Indicator(
+        ["BBANDS_U", "BBANDS_M", "BBANDS_L"],
+        lambda x: tb.BBANDS(
+            x["close"], timeperiod=period, nbdevup=nbdev, nbdevdn=nbdev, matype=0
+        ),
+    )
+
+
+def ad():
+    return Indicator(
+        ["AD"], lambda x: [tb.AD(x["high"], x["low"], x["close"], x["volume"])]
+    )
+
+
+def atr(period=14):
+    return Indicator(["ATR"], lambda x: [wilder_average(x.true_range(), period)])
+
+
+def ht_dcperiod():
+    return Indicator(["HT_DC"], lambda x: [tb.HT_DCPERIOD(x["close"])])
+
+
+# the indicator set of run_forest.Data, volume averages get their own VMA columns
+DEFAULT_INDICATORS = [
+    moving_averages("close", [5, 10, 20, 60, 120], "MA"),
+    moving_averages("volume", [5, 10, 20], "VMA"),
+    adx(14),
+    adxr(14),
+    macd(12, 26, 9),
+    rsi(14),
+    bbands(5, 2),
+    ad(),
+    atr(14),
+    ht_dcperiod(),
+]
+
+
+def compute_indicators(o, h, l, c, v, indicators=DEFAULT_INDICATORS):
+    """Returns the (n bars x n outputs) float64 matrix and its column names."""
+    inputs = IndicatorInputs(o, h, l, c, v)
+    names = [name for indicator in indicators for name in indicator.outputs]
+    matrix = np.empty((inputs.n, len(names)), dtype=np.float64)
+    j = 0
+    for indicator in indicators:
+        for values in indicator.compute(inputs):
+            matrix[:, j] = values
+            j += 1
+    return matrix, names
+
+
+def indicators_frame(df, indicators=DEFAULT_INDICATORS):
+    """Indicators of a frame holding Open, High, Low, Close and Volume columns, on the same index."""
+    matrix, names = compute_indicators(
+        df["Open"].values,
+        df["High"].values,
+        df["Low"].values,
+        df["Close"].values,
+        df["Volume"].values,
+        indicators,
+    )
+    return pd.DataFrame(matrix, index=df.index, columns=names, copy=False)
+
+
+# ------------------------------------------- PANEL MODE -------------------------------------------
+# Arrays are (dates x symbols), every kernel works on all the symbols at once along axis 0.
+# Missing bars are NaN, a window holding a NaN gives NaN, as talib does on a single series.
+
+
+def rolling_mean(x, period):
+    valid = ~np.isnan(x)
+    total = np.zeros((x.shape[0] + 1,) + x.shape[1:])
+    count = np.zeros((x.shape[0] + 1,) + x.shape[1:])
+    np.cumsum(np.where(valid, x, 0.0), axis=0, out=total[1:])
+    np.cumsum(valid, axis=0, out=count[1:])
+    out = np.full(x.shape, np.nan)
+    if x.shape[0] >= period:
+        full = count[period:] - count[:-period] == period
+        out[period - 1 :] = np.where(
+            full, (total[period:] - total[:-period]) / period, np.nan
+        )
+    return out
+
+
+def rolling_std(x, period):
+    """Population standard deviation over `period` bars, as used by talib BBANDS."""
+    # centering each symbol first keeps the sum of squares away from catastrophic cancellation
+    centered = x - np.nanmean(x, axis=0)
+    mean = rolling_mean(centered, period)
+    variance = rolling_mean(centered**2, period) - mean**2
+    return np.sqrt(np.maximum(variance, 0.0))
+
+
+def wilder_panel(x, period):
+    """
+    Wilder smoothing of every column, seeded with the mean of its first `period` valid values.
+    The loop runs over dates only, each step updates all the symbols.
+    """
+    out = np.full(x.shape, np.nan)
+    state = np.full(x.shape[1:], np.nan)
+    seed = np.zeros(x.shape[1:])
+    count = np.zeros(x.shape[1:], dtype=int)
+    for t in range(x.shape[0]):
+        row = x[t]
+        valid = ~np.isnan(row)
+        seeding = valid & (count < period)
+        seed[seeding] += row[seeding]
+        count[valid] += 1
+        started = seeding & (count == period)
+        state[started] = seed[started] / period
+        smoothing = valid & ~seeding
+        state[smoothing] = (state[smoothing] * (period - 1) + row[smoothing]) / period
+        out[t, valid] = state[valid]
+    return out
+
+
+def ema_panel(x, period, seed_end=None):
+    """
+    Exponential moving average of every column, seeded with the simple mean of the `period` bars
+    ending at `seed_end` (by default the first full window). Columns are expected to be gap free
+    once they start.
+    """
+    k = 2.0 / (period + 1)
+    first = np.argmax(~np.isnan(x), axis=0)
+    seed_end = first + period - 1 if seed_end is None else first + seed_end
+    out = np.full(x.shape, np.nan)
+    sma = rolling_mean(x, period)
+    in_range = seed_end < x.shape[0]
+    state = np.full(x.shape[1:], np.nan)
+    for t in range(x.shape[0]):
+        starting = in_range & (seed_end == t)
+        state[starting] = sma[t, starting]
+        running = in_range & (seed_end < t)
+        state[running] = x[t, running] * k + state[running] * (1 - k)
+        ready = in_range & (seed_end <= t)
+        out[t, ready] = state[ready]
+    return out
+
+
+def true_range_panel(high, low, close):
+    previous_close = np.vstack([np.full((1,) + close.shape[1:], np.nan), close[:-1]])
+    return np.maximum(high, previous_close) - np.minimum(low, previous_close)
+
+
+def rsi_panel(close, period=14):
+    change = np.vstack(
+        [np.full((1,) + close.shape[1:], np.nan), np.diff(close, axis=0)]
+    )
+    # np.maximum and np.minimum keep the NaN of missing bars
+    gain = wilder_panel(np.maximum(change, 0.0), period)
+    loss = wilder_panel(-np.minimum(change, 0.0), period)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rsi = 100 * gain / (gain + loss)
+    rsi[gain + loss == 0] = 0.0
+    return rsi
+
+
+def macd_panel(close, fast=12, slow=26, signal=9):
+    """MACD line, aligned as talib MACD: both averages start at the first full slow window."""
+    line = ema_panel(close, fast, seed_end=slow - 1) - ema_panel(close, slow)
+    # talib only reports the line once the signal average is available too
+    first = np.argmax(~np.isnan(close), axis=0) + slow + signal - 2
+    line[np.arange(close.shape[0])[:, None] < first] = np.nan
+    return line
+
+
+def garman_klass_panel(open_, high, low, close):
+    return ((np.log(high) - np.log(low)) ** 2) / 2 - (2 * np.log(2) - 1) * (
+        (np.log(close) - np.log(open_)) ** 2
+    )
+
+
+def panel_indicators(
+    open_,
+    high,
+    low,
+    close,
+    volume,
+    ma_periods=(5, 10, 20, 60, 120),
+    volume_ma_periods=(5, 10, 20),
+    rsi_period=14,
+    bb_period=5,
+    bb_nbdev=2,
+    atr_period=14,
+    macd_periods=(12, 26, 9),
+):
+    """
+    Indicators of the whole universe in one call. The inputs are (dates x symbols) arrays,
+    the result is a (dates x symbols x features) float64 tensor and the feature names.
+    """
+    open_, high, low, close, volume = (
+        np.asarray(x, dtype=float) for x in (open_, high, low, close, volume)
+    )
+    names = (
+        [f"MA{period}" for period in ma_periods]
+        + [f"VMA{period}" for period in volume_ma_periods]
+        + ["RSI", "BBANDS_U", "BBANDS_M", "BBANDS_L", "ATR", "MACD", "garman_klass_vol"]
+    )
+    tensor = np.empty(close.shape + (len(names),), dtype=np.float64)
+    j = 0
+    for period in ma_periods:
+        tensor[:, :, j] = rolling_mean(close, period)
+        j += 1
+    for period in volume_ma_periods:
+        tensor[:, :, j] = rolling_mean(volume, period)
+        j += 1
+    tensor[:, :, j] = rsi_panel(close, rsi_period)
+    middle = rolling_mean(close, bb_period)
+    deviation = bb_nbdev * rolling_std(close, bb_period)
+    tensor[:, :, j + 1] = middle + deviation
+    tensor[:, :, j + 2] = middle
+    tensor[:, :, j + 3] = middle - deviation
+    tensor[:, :, j + 4] = wilder_panel(true_range_panel(high, low, close), atr_period)
+    tensor[:, :, j + 5] = macd_panel(close, *macd_periods)
+    tensor[:, :, j + 6] = garman_klass_panel(open_, high, low, close)
+    return tensor, names
+
+
+def price_panel(store, start=None, end=None, symbols=None):
+    """
+    (dates x symbols) arrays of the OHLCV columns read from a price store in one slice,
+    returned as a dict keyed by column along with the dates and the symbols.
+    """
+    columns = ["Open", "High", "Low", "Close", "Volume"]
+    frame = store.read_slice(start, end, symbols=symbols, columns=columns)
+    wide = frame.pivot(index="Date", columns="symbol", values=columns).sort_index()
+    symbols = list(wide["Close"].columns)
+    return (
+        {column: wide[column][symbols].values for column in columns},
+        wide.index,
+        symbols,
+    )
+
+
+def universe_indicators(store, start=None, end=None, symbols=None):
+    """panel_indicators of every symbol of the store between `start` and `end`."""
+    panel, dates, symbols = price_panel(store, start, end, symbols)
+    tensor, names = panel_indicators(
+        panel["Open"], panel["High"], panel["Low"], panel["Close"], panel["Volume"]
+    )
+    return tensor, dates, symbols, names
@@ -0,0 +1,222 @@
+import multiprocessing
+import sqlite3
+from asyncio.log import logger
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from scanner import UniverseScanner
+
+"""
+Checkpointed execution of a per-ticker job such as the run_filters screen.
+
+Every finished ticker is journaled to SQLite straight away with its outcome, so a job that dies
+half way is resumed by running it again under the same job id: tickers already in the journal are
+skipped. The remaining tickers can be split in shards, each scanned by its own worker process.
+"""
+
+PASS = "pass"
+FAIL = "fail"
+DEAD = "dead"
+ERROR = "error"
+# fetched and listed, not scored yet
+LISTED = "listed"
+
+
+class Journal:
+
+    def __init__(self, path, job):
+        self.path = path
+        self.job = job
+        # several shard processes write to the same file
+        self._conn = sqlite3.connect(path, timeout=60)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS journal (
+                job TEXT NOT NULL,
+                ticker TEXT NOT NULL,
+                outcome TEXT NOT NULL,
+                average_roe REAL,
+                score REAL,
+                error TEXT,
+                finished_at TEXT NOT NULL,
+                PRIMARY KEY (job, ticker)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def write(self, ticker, outcome, average_roe=None, score=None, error=None):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO journal VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self.job,
+                    ticker,
+                    outcome,
+                    average_roe,
+                    score,
+                    error,
+                    datetime.now().isoformat(),
+                ),
+            )
+
+    def write_many(self, rows):
+        """(ticker, outcome, average_roe, score) rows, in one transaction."""
+        now = datetime.now().isoformat()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO journal VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (self.job, ticker, outcome, average_roe, score, None, now)
+                    for ticker, outcome, average_roe, score in rows
+                ],
+            )
+
+    def done(self, include_errors=True):
+        query = "SELECT ticker FROM journal WHERE job = ?"
+        params = [self.job]
+        if not include_errors:
+            query += " AND outcome != ?"
+            params.append(ERROR)
+        return {row[0] for row in self._conn.execute(query, params)}
+
+    def results(self):
+        return pd.read_sql(
+            "SELECT ticker, outcome, average_roe, score, error, finished_at FROM journal WHERE job = ?",
+            self._conn,
+            params=[self.job],
+        )
+
+
+def shard(tickers, n_shards):
+    return [tickers[i::n_shards] for i in range(n_shards)]
+
+
+def shard_params(scanner_params, n_shards):
+    """
+    UniverseScanner keywords of one of `n_shards` shards. The shards scan interleaved tickers, so they
+    hit the same exchanges at the same time: the rate, the burst and the per exchange limits are
+    split between them, the counts keeping at least 1.
+    """
+    params = dict(scanner_params)
+    if "rate" in params:
+        params["rate"] = params["rate"] / n_shards
+    if "burst" in params:
+        params["burst"] = max(1, params["burst"] // n_shards)
+    if params.get("exchange_limits"):
+        params["exchange_limits"] = {
+            exchange: max(1, limit // n_shards)
+            for exchange, limit in params["exchange_limits"].items()
+        }
+    if "default_limit" in params:
+        params["default_limit"] = max(1, params["default_limit"] // n_shards)
+    return params
+
+
+def run_shard(journal_path, job, tickers, fetcher, scanner_params):
+    """
+    Scan `tickers` and journal each outcome as soon as it comes back.
+    `fetcher` returns a dict with the Journal.write keywords (outcome, average_roe, score).
+    """
+    journal = Journal(journal_path, job)
+    scanner = UniverseScanner(fetcher, **scanner_params)
+    n = 0
+    for ticker, result, error in scanner.scan(tickers):
+        if error is not None:
+            print(f"{ticker} ... failed", error)
+            journal.write(ticker, ERROR, error=repr(error))
+        else:
+            journal.write(ticker, **result)
+        n += 1
+    journal.close()
+    return n
+
+
+class JobRunner:
+    """
+    Parameters
+    --------
+        journal_path : str
+            SQLite file holding the journal
+        job : str
+            Job id, running again with the same id resumes the job
+        fetcher : callable
+            Module level function (it is sent to the worker processes) returning the outcome of a ticker
+        n_workers : int
+            Number of shard processes, 1 runs in the current process
+        retry_errors : bool
+            Whether tickers journaled as errors are tried again on resume
+        scanner_params :
+            UniverseScanner keywords. The request rate, burst and exchange limits are split evenly
+            between the shards (see shard_params).
+    """
+
+    def __init__(
+        self,
+        journal_path,
+        job,
+        fetcher,
+        n_workers=1,
+        retry_errors=True,
+        **scanner_params,
+    ):
+        self.journal_path = journal_path
+        self.job = job
+        self.fetcher = fetcher
+        self.n_workers = n_workers
+        self.retry_errors = retry_errors
+        self.scanner_params = scanner_params
+
+    def run(self, tickers):
+        journal = Journal(self.journal_path, self.job)
+        done = journal.done(include_errors=not self.retry_errors)
+        pending = [ticker for ticker in tickers if ticker not in done]
+        logger.info(
+            f"job {self.job}: {len(done)} tickers already journaled, {len(pending)} to go"
+        )
+
+        if pending:
+            if self.n_workers <= 1:
+                run_shard(
+                    self.journal_path,
+                    self.job,
+                    pending,
+                    self.fetcher,
+                    self.scanner_params,
+                )
+            else:
+                params = shard_params(self.scanner_params, self.n_workers)
+                # sqlite connections and yfinance sessions do not survive a fork
+                context = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(
+                    self.n_workers, mp_context=context
+                ) as executor:
+                    futures = [
+                        executor.submit(
+                            run_shard,
+                            self.journal_path,
+                            self.job,
+                            part,
+                            self.fetcher,
+                            params,
+                        )
+                        for part in shard(pending, self.n_workers)
+                    ]
+                    for future in futures:
+                        future.result()
+
+        results = journal.results()
+        journal.close()
+        return results
+
+    def record(self, rows):
+        """Journal the outcomes of a step run after the fetch, see Journal.write_many."""
+        journal = Journal(self.journal_path, self.job)
+        journal.write_many(rows)
+        journal.close()
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+"""
+Lagged (T-0 .. T-n) feature columns built as strided views over one contiguous array,
+and the design matrix of run_forest.Data assembled in a single allocation.
+"""
+
+
+def lag_view(values, seq_length):
+    """
+    Read-only (n, seq_length, k) view of the (n, k) `values`, [t, i] being the row t - i
+    (NaN before the first row). Only the padded base array is allocated, lags are not copied.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    n, k = values.shape
+    padded = np.empty((n + seq_length - 1, k))
+    padded[: seq_length - 1] = np.nan
+    padded[seq_length - 1 :] = values
+    # windows[t, :, j] is padded[t + j], i.e. the row t - (seq_length - 1 - j) of values
+    windows = sliding_window_view(padded, seq_length, axis=0)
+    return windows[:, :, ::-1].transpose(0, 2, 1)
+
+
+def lag_names(columns, seq_length):
+    return [f"{c}T-{i}" for i in range(seq_length) for c in columns]
+
+
+def design_matrix(frame, columns, seq_length, blocks=(), label=None):
+    """
+    One float64 matrix holding the lagged `columns` of `frame`, then the columns of every frame in
+    `blocks` (aligned by position), then `label` when given.
+    Returns X and, with a label, Xy as DataFrames over that same matrix, X being a view of Xy.
+    """
+    lags = lag_view(frame[columns].values, seq_length)
+    n = len(frame)
+    names = lag_names(columns, seq_length)
+    width = len(names) + sum(block.shape[1] for block in blocks)
+    matrix = np.empty((n, width + (label is not None)), dtype=np.float64)
+
+    matrix[:, : len(names)].reshape(n, seq_length, len(columns))[...] = lags
+    j = len(names)
+    for block in blocks:
+        matrix[:, j : j + block.shape[1]] = block.values
+        names += list(block.columns)
+        j += block.shape[1]
+
+    X = pd.DataFrame(matrix[:, :width], index=frame.index, columns=names, copy=False)
+    if label is None:
+        return X, None
+    matrix[:, width] = label.values
+    Xy = pd.DataFrame(
+        matrix, index=frame.index, columns=names + [label.name], copy=False
+    )
+    return X, Xy
+
+
+def split_design_matrix(Xy):
+    """X as a view over the columns of an Xy built by design_matrix, without its label."""
+    matrix = Xy.values
+    return pd.DataFrame(
+        matrix[:, :-1], index=Xy.index, columns=Xy.columns[:-1], copy=False
+    )
@@ -0,0 +1,165 @@
+import pandas as pd
+
+"""
+Cross-sectional versions of Stock_Info.roe_filter and Stock_Info.piotroski_score.
+
+Both take the long-format fundamentals panel kept by FundamentalsStore, one row per
+(ticker, statement, period, item, value), and score every ticker in it with column operations
+instead of constructing one Stock_Info per symbol. Fiscal periods are matched by position the same
+way Stock_Info does (0 = latest column of each statement, 1 = the one before, ...).
+"""
+
+ITEMS = {
+    "income_stmt": ["Net Income", "Total Revenue", "Cost of Revenue"],
+    "balance_sheet": [
+        "Total Assets",
+        "Common Stock Equity",
+        "Current Assets",
+        "Current Liabilities",
+        "Long Term Debt",
+        "Long Term Debt And Capital Lease Obligation",
+    ],
+    "cash_flow": ["Operating Cash Flow"],
+}
+
+PIOTROSKI_COMPONENTS = [
+    "net_income",
+    "operating_cash_flow",
+    "return_on_assets",
+    "earnings_quality",
+    "lower_leverage",
+    "higher_current_ratio",
+    "no_dilution",
+    "higher_gross_margin",
+    "higher_asset_turnover",
+]
+
+
+def statement_matrix(panel):
+    """
+    Pivot the long panel to one row per (ticker, rank) and one column per (statement, item),
+    where rank is the position of the fiscal period inside its statement, latest first.
+    Only the line items used by the scores are kept.
+    """
+    wanted = [(statement, item) for statement, items in ITEMS.items() for item in items]
+    keys = pd.MultiIndex.from_arrays([panel["statement"], panel["item"]])
+    panel = panel[keys.isin(wanted)].copy()
+    panel["rank"] = (
+        panel.groupby(["ticker", "statement"])["period"]
+        .rank(method="dense", ascending=False)
+        .astype(int)
+        - 1
+    )
+    wide = panel.set_index(["ticker", "rank", "statement", "item"])["value"].unstack(
+        ["statement", "item"]
+    )
+    return wide.reindex(columns=pd.MultiIndex.from_tuples(wanted)).astype(float)
+
+
+def _present(x):
+    # a line item that is missing or zero counts as absent, like the truthiness checks in Stock_Info
+    return x.notna() & (x != 0)
+
+
+def roe_scores(panel, average_roe_requirement, min_roe_requirement, min_history=4):
+    """
+    Average ROE, min ROE and number of years of history for every ticker, and whether it passes
+    the same filter as Stock_Info.roe_filter.
+    """
+    wide = statement_matrix(panel)
+    net_income = wide[("income_stmt", "Net Income")]
+    equity = wide[("balance_sheet", "Common Stock Equity")]
+
+    valid = net_income.notna()
+    roe = (net_income / equity).where(valid)
+    by_ticker = roe.groupby(level="ticker")
+    history_length = valid.groupby(level="ticker").sum()
+    average_roe = by_ticker.sum() / history_length.where(history_length > 0)
+    # a reported net income without matching equity poisons the average, as in the loop version
+    broken = (valid & roe.isna()).groupby(level="ticker").any()
+    average_roe = average_roe.mask(broken)
+    min_roe = by_ticker.min()
+
+    result = pd.DataFrame(
+        {
+            "average_roe": average_roe,
+            "min_roe": min_roe,
+            "history_length": history_length,
+        }
+    )
+    result["passed"] = (
+        (result["min_roe"] >= min_roe_requirement)
+        & (result["average_roe"] >= average_roe_requirement)
+        & (result["history_length"] >= min_history)
+    )
+    return result
+
+
+def piotroski_scores(panel, shares_statement):
+    """
+    All nine Piotroski components as boolean columns plus their sum in `score`, one row per ticker.
+    `shares_statement` is the statement name the share count history is stored under.
+    """
+    wide = statement_matrix(panel)
+    rank = wide.index.get_level_values("rank")
+    latest = wide[rank == 0].droplevel("rank")
+    previous = wide[rank == 1].droplevel("rank").reindex(latest.index)
+
+    ni = latest[("income_stmt", "Net Income")]
+    ocf = latest[("cash_flow", "Operating Cash Flow")]
+    sales = latest[("income_stmt", "Total Revenue")]
+    p_sales = previous[("income_stmt", "Total Revenue")]
+    cogs = latest[("income_stmt", "Cost of Revenue")]
+    p_cogs = previous[("income_stmt", "Cost of Revenue")]
+    assets = latest[("balance_sheet", "Total Assets")]
+    p_assets = previous[("balance_sheet", "Total Assets")]
+
+    components = pd.DataFrame(index=latest.index)
+
+    # Profitability
+    components["net_income"] = ni > 1
+    components["operating_cash_flow"] = ocf > 1
+    components["return_on_assets"] = ni / assets > 1
+    components["earnings_quality"] = ocf > ni
+
+    # Leverage, liquidity and source of funds
+    debt = latest[("balance_sheet", "Long Term Debt")]
+    p_debt = previous[("balance_sheet", "Long Term Debt")]
+    use_lease = ~_present(debt) | _present(p_debt)
+    lease_item = ("balance_sheet", "Long Term Debt And Capital Lease Obligation")
+    debt = debt.where(~use_lease, latest[lease_item])
+    p_debt = p_debt.where(~use_lease, previous[lease_item])
+    components["lower_leverage"] = _present(debt) & _present(p_debt) & (debt < p_debt)
+
+    ca = latest[("balance_sheet", "Current Assets")]
+    cl = latest[("balance_sheet", "Current Liabilities")]
+    p_ca = previous[("balance_sheet", "Current Assets")]
+    p_cl = previous[("balance_sheet", "Current Liabilities")]
+    components["higher_current_ratio"] = (
+        _present(ca)
+        & _present(cl)
+        & _present(p_ca)
+        & _present(p_cl)
+        & (ca / cl > p_ca / p_cl)
+    )
+
+    shares = panel[panel["statement"] == shares_statement].sort_values("period")
+    shares = shares.groupby("ticker")["value"]
+    first_shares, last_shares = shares.first(), shares.last()
+    no_dilution = (
+        _present(first_shares) & _present(last_shares) & (last_shares < first_shares)
+    )
+    components["no_dilution"] = no_dilution.reindex(latest.index, fill_value=False)
+
+    # Operating efficiency
+    components["higher_gross_margin"] = _present(cogs) & (
+        (sales - cogs) / cogs > (p_sales - p_cogs) / p_cogs
+    )
+    average_assets = assets + p_assets
+    components["higher_asset_turnover"] = (
+        2 * sales / average_assets > 2 * p_sales / average_assets
+    )
+
+    components = components.astype(bool)
+    components["score"] = components[PIOTROSKI_COMPONENTS].sum(axis=1)
+    return components
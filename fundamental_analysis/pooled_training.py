@@ -0,0 +1,252 @@
+import json
+import math
+from asyncio.log import logger
+
+import numpy as np
+import pandas as pd
+from sklearn.metrics import accuracy_score
+from xgboost import XGBClassifier
+
+from config import POOLED_HALVING_ETA, POOLED_MODEL, POOLED_NFOLD, POOLED_SUMMARY
+from config import POOLED_TEST_SIZE, SELECTION_PLAN_GROUPS, XGB_CHUNK_ROWS
+from config import (
+    XGB_EXTERNAL_MEMORY,
+    XGB_MAX_BIN,
+    XGB_SEARCH_SPACE,
+    XGB_SEARCH_WORKERS,
+)
+from feature_cache import FeatureCache
+from hyperparameter_search import HyperparameterSearch
+from run_forest import Data, target_list
+from scanner import exchange_of
+
+"""
+One XGBoost model for every ticker, trained on their stacked feature matrices.
+
+The rows of all tickers (Data.feature_matrix, with the label of run_forest) go into one matrix,
+with the ticker, its exchange and its group (config.SELECTION_PLAN_GROUPS, e.g. its sector) as
+categorical columns. The depth search of run_forest.XGB_training then runs once on the pooled rows
+instead of once per ticker. The last `test_size` of the dates are held out, for every ticker at once,
+and the accuracy on them is reported per ticker.
+
+The trained PooledModel predicts any ticker's rows, tickers it was not trained on included
+(their ticker code is then missing, their exchange and group still count).
+"""
+
+CATEGORIES = ["symbol", "exchange", "group"]
+
+
+def category_codes(symbols, groups=SELECTION_PLAN_GROUPS):
+    """Category -> {value: integer code} of the tickers `symbols`."""
+    values = {
+        "symbol": symbols,
+        "exchange": [exchange_of(symbol) for symbol in symbols],
+        "group": [groups[symbol] for symbol in symbols if symbol in groups],
+    }
+    return {
+        category: {
+            value: code for code, value in enumerate(sorted(set(values[category])))
+        }
+        for category in CATEGORIES
+    }
+
+
+def encode(symbol, codes, groups=SELECTION_PLAN_GROUPS):
+    """Codes of `symbol` in the order of CATEGORIES, NaN for values not seen in training."""
+    values = [symbol, exchange_of(symbol), groups.get(symbol)]
+    return [codes[c].get(v, np.nan) for c, v in zip(CATEGORIES, values)]
+
+
+def ticker_rows(symbol, store=None, feature_cache=None, seq_length=3):
+    """Dates, features and labels of one ticker, the rows run_forest.Data trains on."""
+    data = Data(symbol, store=store, feature_cache=feature_cache)
+    data.feature_matrix(seq_length)
+    return data.daily_data["Date"].values, data.X, data.y.values
+
+
+class PooledModel:
+    """
+    Parameters
+    --------
+        model : XGBClassifier
+            Trained on the feature columns followed by the category codes
+        columns : list
+            Feature columns
+        codes : dict
+            See category_codes
+    """
+
+    def __init__(self, model, columns, codes):
+        self.model = model
+        self.columns = columns
+        self.codes = codes
+
+    def matrix(self, symbol, X):
+        """Features X of `symbol` with its category codes appended."""
+        matrix = np.empty((len(X), len(self.columns) + len(CATEGORIES)))
+        matrix[:, : len(self.columns)] = X[self.columns].values
+        matrix[:, len(self.columns) :] = encode(symbol, self.codes)
+        return matrix
+
+    def predict_proba(self, symbol, X):
+        return self.model.predict_proba(self.matrix(symbol, X))[:, 1]
+
+    def predict(self, symbol, X):
+        return self.model.predict(self.matrix(symbol, X))
+
+    def save(self, path=POOLED_MODEL):
+        self.model.save_model(path)
+        with open(f"{path}.meta.json", "w") as f:
+            json.dump({"columns": self.columns, "codes": self.codes}, f)
+
+    @classmethod
+    def load(cls, path=POOLED_MODEL):
+        model = XGBClassifier()
+        model.load_model(path)
+        with open(f"{path}.meta.json") as f:
+            meta = json.load(f)
+        return cls(model, meta["columns"], meta["codes"])
+
+
+class PooledTraining:
+    """
+    Parameters
+    --------
+        symbols : list
+            Tickers to pool, those whose data cannot be built are left out (see `failed`)
+        store, feature_cache :
+            As for run_forest.Data
+        test_size : float
+            Fraction of the most recent dates held out
+        n_jobs : int
+            XGBoost threads, None leaves it to XGBoost
+    """
+
+    def __init__(
+        self,
+        symbols,
+        store=None,
+        feature_cache=None,
+        test_size=POOLED_TEST_SIZE,
+        n_jobs=None,
+    ):
+        self.symbols = symbols
+        self.store = store
+        self.feature_cache = feature_cache
+        self.test_size = test_size
+        self.n_jobs = n_jobs
+        self.failed = {}
+
+    def stack(self):
+        """Pooled (dates, matrix, labels, symbol of each row) of the tickers, in one allocation."""
+        parts = {}
+        for symbol in self.symbols:
+            try:
+                parts[symbol] = ticker_rows(symbol, self.store, self.feature_cache)
+            except Exception as e:
+                logger.warning(f"{symbol}: left out of the pooled data, {e!r}")
+                self.failed[symbol] = repr(e)
+        if not parts:
+            raise ValueError("no ticker to pool")
+        self.columns = list(next(iter(parts.values()))[1].columns)
+        self.codes = category_codes(list(parts))
+        n = sum(len(y) for _, _, y in parts.values())
+
+        matrix = np.empty((n, len(self.columns) + len(CATEGORIES)))
+        labels = np.empty(n, dtype=int)
+        dates = np.empty(n, dtype="datetime64[ns]")
+        symbols = np.empty(n, dtype=object)
+        start = 0
+        for symbol, (ticker_dates, X, y) in parts.items():
+            end = start + len(y)
+            matrix[start:end, : len(self.columns)] = X[self.columns].values
+            matrix[start:end, len(self.columns) :] = encode(symbol, self.codes)
+            labels[start:end] = y
+            dates[start:end] = ticker_dates
+            symbols[start:end] = symbol
+            start = end
+        return dates, matrix, labels, symbols
+
+    def run(self):
+        """Trains the pooled model, returns it with the per ticker accuracy on the held out dates."""
+        dates, matrix, labels, symbols = self.stack()
+        cutoff = np.quantile(dates.astype(np.int64), 1 - self.test_size)
+        test = dates.astype(np.int64) > cutoff
+        feature_types = ["q"] * len(self.columns) + ["c"] * len(CATEGORIES)
+
+        search = HyperparameterSearch(
+            base_params=dict(
+                n_estimators=1000,
+                min_child_weight=1,
+                gamma=1,
+                subsample=1,
+                random_state=42,
+                n_jobs=self.n_jobs,
+            ),
+            space=XGB_SEARCH_SPACE,
+            num_boost_round=1000,
+            early_stopping_rounds=50,
+            nfold=POOLED_NFOLD,
+            metric="auc",
+            seed=42,
+            n_workers=XGB_SEARCH_WORKERS,
+            n_jobs=self.n_jobs,
+            eta=POOLED_HALVING_ETA,
+            max_bin=XGB_MAX_BIN,
+            chunk_rows=XGB_CHUNK_ROWS,
+            external_memory=XGB_EXTERNAL_MEMORY,
+            feature_types=feature_types,
+        )
+        results = search.run(
+            matrix[~test], labels[~test], feature_names=self.columns + CATEGORIES
+        )
+        for rung in search.history[:-1]:
+            print(
+                "{} candidates cross-validated over {} rounds, {} kept.".format(
+                    len(rung), rung[0].rounds, math.ceil(len(rung) / search.eta)
+                )
+            )
+        best = max(results, key=lambda result: result.cv_mean)
+        print(
+            "Best candidate {}: {} trees, CV-mean: {:.4f}, CV-std: {:.4f}.".format(
+                best.params, best.n_trees, best.cv_mean, best.cv_std
+            )
+        )
+        model = search.fit(best.params, best.n_trees, matrix[test], labels[test])
+        self.model = PooledModel(model, self.columns, self.codes)
+        self.best = best
+
+        predictions = model.predict(matrix[test])
+        summary = pd.DataFrame(
+            {"symbol": symbols[test], "label": labels[test], "prediction": predictions}
+        )
+        summary = summary.groupby("symbol").apply(
+            lambda rows: pd.Series(
+                {
+                    "n_test": len(rows),
+                    "accuracy": accuracy_score(rows["label"], rows["prediction"]),
+                }
+            ),
+            include_groups=False,
+        )
+        summary.insert(0, "n_train", pd.Series(symbols[~test]).value_counts())
+        return self.model, summary.reset_index()
+
+
+def main(tickers=target_list):
+    """Trains the pooled model of the target list, saves it and prints the accuracy of every ticker."""
+    training = PooledTraining(tickers, feature_cache=FeatureCache())
+    model, summary = training.run()
+    model.save(POOLED_MODEL)
+    summary.to_csv(POOLED_SUMMARY, index=False)
+    print("\n")
+    print(summary.to_string())
+    print(
+        f"\nPooled accuracy: {np.average(summary['accuracy'], weights=summary['n_test']):.4f}"
+    )
+    if training.failed:
+        print(f"Left out: {', '.join(training.failed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+import os
+import sqlite3
+import sys
+from asyncio.log import logger
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from config import PRICE_BACKEND, PRICE_DB, PRICE_PARQUET_DIR
+
+"""
+Daily bars of every symbol in a single long table, (symbol, date) being the primary key,
+so a date range of one symbol is an index range scan and a date slice of the whole universe is one query.
+
+Frames going in and out use the yahoo layout (Date, Open, High, Low, Close, Adj Close, Volume columns),
+the table itself uses lower case column names.
+"""
+
+COLUMNS = {
+    "Open": "open",
+    "High": "high",
+    "Low": "low",
+    "Close": "close",
+    "Adj Close": "adj_close",
+    "Volume": "volume",
+}
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+# column order of the legacy per-symbol tables, as run_forest.Data used to name them
+LEGACY_COLUMNS = ["Date", "Close", "High", "Low", "Open", "Volume"]
+
+
+def _date_param(date):
+    return None if date is None else pd.Timestamp(date).strftime(DATE_FORMAT)
+
+
+class PriceStore:
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS bars (
+                symbol TEXT NOT NULL,
+                date TEXT NOT NULL,
+                open REAL,
+                high REAL,
+                low REAL,
+                close REAL,
+                adj_close REAL,
+                volume REAL,
+                PRIMARY KEY (symbol, date)
+            ) WITHOUT ROWID
+            """
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def symbols(self):
+        return [
+            row[0] for row in self._conn.execute("SELECT DISTINCT symbol FROM bars")
+        ]
+
+    def last_dates(self):
+        """Latest stored bar date of every symbol."""
+        rows = self._conn.execute("SELECT symbol, MAX(date) FROM bars GROUP BY symbol")
+        return {symbol: pd.Timestamp(last) for symbol, last in rows}
+
+    def write(self, symbol, frame, replace=False):
+        """
+        Insert (or overwrite) the bars of `frame` for `symbol` in one transaction,
+        `replace` drops the symbol's stored history first.
+        """
+        rows = pd.DataFrame(
+            {
+                "symbol": symbol,
+                "date": pd.to_datetime(frame["Date"]).dt.strftime(DATE_FORMAT),
+            }
+        )
+        for column, name in COLUMNS.items():
+            rows[name] = frame[column].astype(float) if column in frame else None
+        rows = rows.astype(object).where(rows.notna(), None)
+
+        with self._conn:
+            if replace:
+                self._conn.execute("DELETE FROM bars WHERE symbol = ?", (symbol,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO bars VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows.itertuples(index=False, name=None),
+            )
+        return len(rows)
+
+    def read(self, symbol, start=None, end=None, columns=None):
+        """
+        Bars of `symbol` between `start` and `end` (inclusive, both optional) in the yahoo layout,
+        restricted to the yahoo named `columns` when given.
+        """
+        columns = columns or list(COLUMNS)
+        selected = ", ".join(COLUMNS[column] for column in columns)
+        query = f"SELECT date, {selected} FROM bars WHERE symbol = ?"
+        params = [symbol]
+        if start is not None:
+            query += " AND date >= ?"
+            params.append(_date_param(start))
+        if end is not None:
+            query += " AND date <= ?"
+            params.append(_date_param(end))
+        query += " ORDER BY date"
+        rows = self._conn.execute(query, params).fetchall()
+        # build the typed arrays directly, read_sql would infer every column from python objects
+        values = np.array([row[1:] for row in rows], dtype=float).reshape(
+            len(rows), len(columns)
+        )
+        frame = pd.DataFrame(values, columns=list(columns))
+        frame.insert(
+            0, "Date", np.array([row[0] for row in rows], dtype="datetime64[ns]")
+        )
+        return frame
+
+    def read_slice(self, start=None, end=None, symbols=None, columns=None):
+        """Long frame (symbol, Date, columns...) of every symbol, or only `symbols`, over a date range."""
+        columns = columns or list(COLUMNS)
+        selected = ", ".join(COLUMNS[column] for column in columns)
+        query = f"SELECT symbol, date, {selected} FROM bars WHERE 1 = 1"
+        params = []
+        if start is not None:
+            query += " AND date >= ?"
+            params.append(_date_param(start))
+        if end is not None:
+            query += " AND date <= ?"
+            params.append(_date_param(end))
+        if symbols is not None:
+            symbols = list(symbols)
+            query += f" AND symbol IN ({', '.join('?' * len(symbols))})"
+            params += symbols
+        frame = pd.read_sql(query, self._conn, params=params)
+        frame.columns = ["symbol", "Date"] + list(columns)
+        frame["Date"] = pd.to_datetime(frame["Date"])
+        frame[columns] = frame[columns].astype(float)
+        return frame
+
+    def migrate_legacy_tables(self, legacy_path=None, drop=False):
+        """
+        Copy the one-table-per-symbol layout written by utility.TOSQL into the bars table.
+        The legacy tables are read from this database unless `legacy_path` points to another file,
+        and dropped afterwards when `drop` is set.
+        """
+        legacy = self._conn if legacy_path is None else sqlite3.connect(legacy_path)
+        symbols = [
+            row[0]
+            for row in legacy.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name != 'bars'"
+            )
+        ]
+        n_symbols, n_rows = 0, 0
+        for symbol in symbols:
+            frame = pd.read_sql(f"SELECT * FROM '{symbol}'", legacy)
+            if "Date" not in frame.columns and len(frame.columns) == len(
+                LEGACY_COLUMNS
+            ):
+                # tables written from multi-level yahoo columns carry tuple-like names
+                frame.columns = LEGACY_COLUMNS
+            if "Date" not in frame.columns:
+                logger.info(f"skipping table {symbol}, it does not hold daily bars")
+                continue
+            n_rows += self.write(symbol, frame)
+            n_symbols += 1
+            if drop:
+                with legacy:
+                    legacy.execute(f"DROP TABLE '{symbol}'")
+        if legacy is not self._conn:
+            legacy.close()
+        logger.info(f"migrated {n_symbols} symbols, {n_rows} bars")
+        return n_rows
+
+
+class ParquetPriceStore:
+    """
+    Same interface as PriceStore with the bars kept as one Parquet file per symbol under
+    `root`/symbol=<symbol>/bars.parquet. Reads are memory-mapped and only decode the requested
+    columns and the row groups inside the date range.
+    """
+
+    def __init__(self, root, row_group_size=4096):
+        self.root = root
+        self.row_group_size = row_group_size
+        os.makedirs(root, exist_ok=True)
+
+    def close(self):
+        pass
+
+    def _path(self, symbol):
+        return os.path.join(self.root, f"symbol={symbol}", "bars.parquet")
+
+    def symbols(self):
+        return sorted(
+            name.split("=", 1)[1]
+            for name in os.listdir(self.root)
+            if name.startswith("symbol=")
+            and os.path.exists(self._path(name.split("=", 1)[1]))
+        )
+
+    def last_dates(self):
+        last = {}
+        for symbol in self.symbols():
+            # the max of the date column is kept in the row group statistics, no data is read
+            metadata = pq.ParquetFile(self._path(symbol)).metadata
+            maxima = [
+                metadata.row_group(i).column(0).statistics.max
+                for i in range(metadata.num_row_groups)
+            ]
+            if maxima:
+                last[symbol] = pd.Timestamp(max(maxima))
+        return last
+
+    def write(self, symbol, frame, replace=False):
+        rows = pd.DataFrame(
+            {"date": pd.to_datetime(frame["Date"]).astype("datetime64[ns]")}
+        )
+        for column, name in COLUMNS.items():
+            rows[name] = (
+                frame[column].astype(float) if column in frame else float("nan")
+            )
+
+        path = self._path(symbol)
+        if not replace and os.path.exists(path):
+            stored = pq.read_table(path, memory_map=True).to_pandas()
+            rows = pd.concat([stored[~stored["date"].isin(rows["date"])], rows])
+        rows = rows.sort_values("date")
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        table = pa.Table.from_pandas(rows, preserve_index=False)
+        pq.write_table(table, path + ".tmp", row_group_size=self.row_group_size)
+        os.replace(path + ".tmp", path)
+        return len(frame)
+
+    @staticmethod
+    def _filters(start, end):
+        filters = []
+        if start is not None:
+            filters.append(("date", ">=", pd.Timestamp(start)))
+        if end is not None:
+            filters.append(("date", "<=", pd.Timestamp(end)))
+        return filters or None
+
+    def read(self, symbol, start=None, end=None, columns=None):
+        columns = columns or list(COLUMNS)
+        path = self._path(symbol)
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=["Date"] + list(columns))
+        table = pq.read_table(
+            path,
+            columns=["date"] + [COLUMNS[column] for column in columns],
+            filters=self._filters(start, end),
+            memory_map=True,
+        )
+        frame = table.to_pandas()
+        frame.columns = ["Date"] + list(columns)
+        return frame
+
+    def read_slice(self, start=None, end=None, symbols=None, columns=None):
+        columns = columns or list(COLUMNS)
+        # symbols such as 200002 must not be inferred as integers
+        partitioning = ds.partitioning(
+            pa.schema([("symbol", pa.string())]), flavor="hive"
+        )
+        dataset = ds.dataset(self.root, format="parquet", partitioning=partitioning)
+        condition = None
+        for name, op, value in self._filters(start, end) or []:
+            clause = ds.field(name) >= value if op == ">=" else ds.field(name) <= value
+            condition = clause if condition is None else condition & clause
+        if symbols is not None:
+            clause = ds.field("symbol").isin(list(symbols))
+            condition = clause if condition is None else condition & clause
+        table = dataset.to_table(
+            columns=["symbol", "date"] + [COLUMNS[column] for column in columns],
+            filter=condition,
+        )
+        frame = table.to_pandas()
+        frame.columns = ["symbol", "Date"] + list(columns)
+        return frame
+
+    def import_from(self, store):
+        """Copy every symbol of another store, e.g. a PriceStore, into this one."""
+        for symbol in store.symbols():
+            self.write(symbol, store.read(symbol), replace=True)
+
+
+def open_price_store(backend=PRICE_BACKEND):
+    """
+    The price store selected in config: PriceStore on PRICE_DB for "sqlite",
+    ParquetPriceStore under PRICE_PARQUET_DIR for "parquet".
+    """
+    if backend == "sqlite":
+        return PriceStore(PRICE_DB)
+    if backend == "parquet":
+        return ParquetPriceStore(PRICE_PARQUET_DIR)
+    raise ValueError('backend must be either "sqlite" or "parquet"')
+
+
+_shared_stores = {}
+
+
+def shared_price_store(backend=PRICE_BACKEND):
+    """
+    One store per backend and process, opened on first use and then reused by every reader
+    instead of opening a new connection per symbol.
+    """
+    if backend not in _shared_stores:
+        _shared_stores[backend] = open_price_store(backend)
+    return _shared_stores[backend]
+
+
+if __name__ == "__main__":
+    # python price_store.py CHINA.db [LEGACY.db] [--drop]
+    # moves the per-symbol tables of LEGACY.db (CHINA.db itself by default) into the bars table of CHINA.db
+    args = [arg for arg in sys.argv[1:] if arg != "--drop"]
+    store = PriceStore(args[0])
+    n = store.migrate_legacy_tables(
+        args[1] if len(args) > 1 else None, drop="--drop" in sys.argv
+    )
+    print(f"migrated {n} bars")
+    store.close()
@@ -1,9 +1,31 @@
-import time
+import sys
 from asyncio.log import logger
+from datetime import date
+from itertools import chain
 
-import pandas as pd
-
-from stock_info import Stock_Info
+from config import (
+    SCAN_RATE_PER_SECOND,
+    SCAN_BURST,
+    SCAN_MAX_WORKERS,
+    SCAN_EXCHANGE_LIMITS,
+    SCAN_RETRIES,
+    SCAN_BACKOFF_SECONDS,
+    FUNDAMENTALS_DB,
+    FUNDAMENTALS_TTL_DAYS,
+    FUNDAMENTALS_FILING_LAG_DAYS,
+    FUNDAMENTALS_RECHECK_DAYS,
+    UNIVERSE_DB,
+    UNIVERSE_REPROBE_DAYS,
+    UNIVERSE_REPROBE_RATE,
+    JOBS_DB,
+    FILTER_WORKERS,
+)
+from fundamentals_store import FundamentalsStore
+from job_runner import DEAD, ERROR, FAIL, LISTED, PASS, JobRunner
+from panel_scoring import piotroski_scores, roe_scores
+from scanner import EmptyResult
+from stock_info import SHARES_STATEMENT, Stock_Info
+from universe_index import UniverseIndex
 from utility import (
     vaid_hk_ticker_generator,
     vaid_shanghai_ticker_generator,
@@ -13,58 +35,132 @@ from utility import (
     sp_500_generator,
 )
 
+# filled by the fetch workers, the scoring reads the whole panel back from it
+fundamentals_store = FundamentalsStore(
+    FUNDAMENTALS_DB,
+    ttl_days=FUNDAMENTALS_TTL_DAYS,
+    filing_lag_days=FUNDAMENTALS_FILING_LAG_DAYS,
+    recheck_days=FUNDAMENTALS_RECHECK_DAYS,
+)
+universe_index = UniverseIndex(UNIVERSE_DB, reprobe_days=UNIVERSE_REPROBE_DAYS)
+
+
+def universe():
+    return universe_index.filter(
+        chain(
+            vaid_shenzhen_ticker_generator(),
+            vaid_shanghai_ticker_generator(),
+            vaid_hk_ticker_generator(),
+            vaid_techboard_ticker_generator(),
+            vaid_b_ticker_generator(),
+            sp_500_generator(),
+        )
+    )
+
+
+def listed(stock):
+    """
+    Whether the code of `stock` is listed: its statements came back, or they came back empty while
+    the code still trades, which means yahoo failed or throttled the statement request and
+    EmptyResult is raised.
+    """
+    if stock.income_stmt.n_periods > 0:
+        return True
+    if stock.has_prices():
+        raise EmptyResult(
+            f"{stock.ticker_name} trades but its statements came back empty"
+        )
+    return False
+
+
+def fundamentals_fetcher(ticker):
+    """
+    Journaled job of a ticker: only fills the fundamentals store and records whether the code is
+    listed, the scoring is done on the whole panel once every ticker is fetched.
+    """
+    stock = Stock_Info(ticker, store=fundamentals_store)
+    stock.prefetch()
+    is_listed = listed(stock)
+    universe_index.record(ticker, is_listed)
+    return {"outcome": LISTED if is_listed else DEAD}
+
+
+def probe_listing(ticker):
+    """
+    Re-probe of a dead or delisted code. A delisted code may still have statements cached from when
+    it was live, so the statements are downloaded again.
+    """
+    stock = Stock_Info(ticker, store=fundamentals_store)
+    stock.prefetch(force=True)
+    return listed(stock)
+
+
+def screen(job, tickers=None, n_workers=FILTER_WORKERS):
+    """
+    ROE filter then piotroski ranking of the universe.
+    Fetching is resumable: every ticker is journaled as it finishes, and running again with the same
+    job id only fetches the tickers that are not journaled yet. The listed tickers are then scored
+    in bulk with panel_scoring (one load of the panel, the vectorized ROE filter and the piotroski
+    ranking of the tickers passing it) and their outcomes written back to the journal.
+    """
+    runner = JobRunner(
+        JOBS_DB,
+        job,
+        fundamentals_fetcher,
+        n_workers=n_workers,
+        rate=SCAN_RATE_PER_SECOND,
+        burst=SCAN_BURST,
+        max_workers=SCAN_MAX_WORKERS,
+        exchange_limits=SCAN_EXCHANGE_LIMITS,
+        retries=SCAN_RETRIES,
+        backoff=SCAN_BACKOFF_SECONDS,
+    )
+    stop_reprobe = universe_index.start_background_reprobe(
+        probe_listing, rate=UNIVERSE_REPROBE_RATE
+    )
+    try:
+        results = runner.run(list(universe() if tickers is None else tickers))
+    finally:
+        stop_reprobe.set()
+
+    listed = results.loc[~results["outcome"].isin([DEAD, ERROR]), "ticker"]
+    panel = fundamentals_store.load_panel(listed)
+    roe = roe_scores(panel, 0.15, 0.09)
+    stock_watch_list = roe[roe["passed"]].sort_values("average_roe")
+    logger.info(
+        f"raw stock watch list: {list(stock_watch_list['average_roe'].items())}"
+    )
+
+    scores = piotroski_scores(
+        panel[panel["ticker"].isin(stock_watch_list.index)], SHARES_STATEMENT
+    )["score"]
+    # scores come back in ticker order, put them in ascending average ROE order first so the
+    # stable sort breaks ties by ROE
+    scores = scores.reindex(
+        stock_watch_list.index.intersection(scores.index, sort=False)
+    ).sort_values(kind="stable")
+    runner.record(
+        (
+            ticker,
+            PASS if passed else FAIL,
+            float(average_roe),
+            float(scores[ticker]) if ticker in scores.index else None,
+        )
+        for ticker, passed, average_roe in zip(
+            roe.index, roe["passed"], roe["average_roe"]
+        )
+    )
 
-def roe_filter():
-    stock_watch_list = []
-
-    for generator in [
-        vaid_shenzhen_ticker_generator(),
-        vaid_shanghai_ticker_generator(),
-        vaid_hk_ticker_generator(),
-        vaid_techboard_ticker_generator(),
-        vaid_b_ticker_generator(),
-        sp_500_generator(),
-    ]:
-        for ticker in generator:
-            try:
-                stock = Stock_Info(ticker)
-                roe = stock.roe_filter(0.15, 0.09)
-                if roe[0]:
-                    average_roe = roe[1]
-                    stock_watch_list.append((ticker, average_roe))
-                    print(
-                        f"ticker {ticker} with roe = {average_roe} has been appended to stock watch list"
-                    )
-                    # pickle_file_path = "D:/alpha_forest/data"
-                    # yt = stock._ticker
-                    # for attr in dir(yt):
-                    #    if isinstance(getattr(ticker, attr), pd.DataFrame):
-                    #        yt.__getattribute__(attr).to_pickle(
-                    #            f"{pickle_file_path}/{ticker}{attr}.pkl"
-                    #        )
-                time.sleep(1)
-            except Exception as e:
-                print(" ... failed", e)
-    return stock_watch_list
-
-
-def piotroski_score_filter(r_list):
-    stock_watch_list_pscore = []
-    for ticker, _ in stock_watch_list:
-        stock = Stock_Info(ticker)
-        stock_watch_list_pscore.append((ticker, stock.piotroski_score()))
-    stock_watch_list_pscore.sort(key=lambda a: a[1])
+    stock_watch_list_pscore = list(scores.astype(int).items())
     print(stock_watch_list_pscore)
-    list_lenth = len(stock_watch_list_pscore)
-    top_twenty_percent = int(list_lenth * 0.2)
+    top_twenty_percent = int(len(stock_watch_list_pscore) * 0.2)
     return stock_watch_list_pscore[-top_twenty_percent:]
 
 
-# step 1:
-stock_watch_list = roe_filter()
-stock_watch_list.sort(key=lambda a: a[1])
-logger.info(f"raw stock watch list: {stock_watch_list}")
-print(f"final target with score:: {piotroski_score_filter(stock_watch_list)}")
+if __name__ == "__main__":
+    # step 1 and 2, run again with the same job id to resume after a crash
+    job = sys.argv[1] if len(sys.argv) > 1 else f"filters-{date.today().isoformat()}"
+    print(f"final target with score:: {screen(job)}")
 
 """Rank from lowest score to highest score for further analysis: 
 remove the ones less than score 5
@@ -3,7 +3,10 @@ import pandas as pd
 import seaborn as sns
 import talib as tb
 
-from alpha_forest.fundamental_analysis.utility import create_engine
+from feature_cache import FeatureCache
+from indicators import DEFAULT_INDICATORS, indicators_frame
+from lag_features import design_matrix, split_design_matrix
+from price_store import shared_price_store
 
 pd.core.common.is_list_like = pd.api.types.is_list_like
 import xgboost
@@ -17,9 +20,19 @@ from pprint import pprint
 
 # Libraries required by FeatureSelector()
 import lightgbm as lgb
-import gc
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor
 from itertools import chain
 from config import raw_china_target_list as raw_target_list
+from config import TRAIN_SUMMARY, TRAIN_THREADS_PER_WORKER, TRAIN_WORKERS
+from config import XGB_HALVING_ETA, XGB_SEARCH_SPACE, XGB_SEARCH_WORKERS
+from config import XGB_CHUNK_ROWS, XGB_EXTERNAL_MEMORY, XGB_MAX_BIN
+from config import FS_IMPORTANCE_WORKERS, FS_RANK_TOLERANCE
+from correlation import DEFAULT_BLOCK_SIZE, correlated_pairs, correlation_frame
+from hyperparameter_search import HyperparameterSearch
+from selection_plan import SelectionPlan, SelectionPlans, plan_scope
+from training_driver import ParallelTrainer
 import os
 
 os.environ["PATH"] += os.pathsep + "C:/Program Files/Graphviz/bin/"
@@ -33,104 +46,136 @@ for ticker, score in raw_target_list:
 # Range of date to train and predict
 START = datetime(2020, 12, 23)
 END = datetime(2024, 12, 23)
+# bump when the lagged columns or the indicator definitions change, cached feature matrices are then rebuilt
+FEATURES_VERSION = 2
+# thresholds of FeatureSelector.identify_all, a stored selection plan is only reused with the same ones
+SELECTION_PARAMS = {
+    "missing_threshold": 0.6,
+    "correlation_threshold": 0.9,
+    "task": "regression",
+    "eval_metric": "auc",
+    "cumulative_importance": 0.99,
+}
 
 
 # ------------------------------------------------ CLASSES --------------------------------------------
 class Data:
 
-    def __init__(self, symbol):
+    def __init__(
+        self,
+        symbol,
+        store=None,
+        start=START,
+        end=END,
+        feature_cache=None,
+        selection_plans=None,
+    ):
         self.q = symbol
+        # every Data instance reads through the same store unless told otherwise
+        self.store = store if store is not None else shared_price_store()
+        self.start = start
+        self.end = end
+        self.feature_cache = feature_cache
+        self.selection_plans = selection_plans
+        self.selection_plan = None
         self._get_daily_data()
-        self.technical_indicators_df()
 
     def _get_daily_data(self):
         """
         This class prepares data by downloading historical data from Yahoo Finance,
-
+        only the bars between start and end and the OHLCV columns are read from the store.
         """
-        ChinaEngine = create_engine("China")
-
-        df = pd.read_sql(f"select * from '{self.q}'", ChinaEngine.raw_connection())
-        df.columns = ["Date", "Close", "High", "Low", "Open", "Volume"]
-        self.daily_data = df
+        self.daily_data = self.store.read(
+            self.q,
+            self.start,
+            self.end,
+            columns=["Close", "High", "Low", "Open", "Volume"],
+        )
 
     def technical_indicators_df(self):
-        o = self.daily_data["Open"].values
-        c = self.daily_data["Close"].values
-        h = self.daily_data["High"].values
-        l = self.daily_data["Low"].values
-        v = self.daily_data["Volume"].astype(float).values
-        # define the technical analysis matrix
-
-        ta = pd.DataFrame()
-        ta["MA5"] = tb.MA(c, timeperiod=5)
-        ta["MA10"] = tb.MA(c, timeperiod=10)
-        ta["MA20"] = tb.MA(c, timeperiod=20)
-        ta["MA60"] = tb.MA(c, timeperiod=60)
-        ta["MA120"] = tb.MA(c, timeperiod=120)
-        ta["MA5"] = tb.MA(v, timeperiod=5)
-        ta["MA10"] = tb.MA(v, timeperiod=10)
-        ta["MA20"] = tb.MA(v, timeperiod=20)
-        ta["ADX"] = tb.ADX(h, l, c, timeperiod=14)
-        ta["ADXR"] = tb.ADXR(h, l, c, timeperiod=14)
-        ta["MACD"] = tb.MACD(c, fastperiod=12, slowperiod=26, signalperiod=9)[0]
-        ta["RSI"] = tb.RSI(c, timeperiod=14)
-        ta["BBANDS_U"] = tb.BBANDS(c, timeperiod=5, nbdevup=2, nbdevdn=2, matype=0)[0]
-        ta["BBANDS_M"] = tb.BBANDS(c, timeperiod=5, nbdevup=2, nbdevdn=2, matype=0)[1]
-        ta["BBANDS_L"] = tb.BBANDS(c, timeperiod=5, nbdevup=2, nbdevdn=2, matype=0)[2]
-        ta["AD"] = tb.AD(h, l, c, v)
-        ta["ATR"] = tb.ATR(h, l, c, timeperiod=14)
-        ta["HT_DC"] = tb.HT_DCPERIOD(c)
-
-        self.ta = ta
+        # define the technical analysis matrix, see indicators.DEFAULT_INDICATORS
+        self.ta = indicators_frame(self.daily_data)
 
     def label(self, df, seq_length):
         return (df["Returns"] > 0).astype(int)
 
-    def preprocessing(self):
+    def features(self, seq_length):
+        """
+        Xy: OHLCV columns lagged 0 to seq_length - 1 bars, the technical indicators and the label,
+        in one matrix (see lag_features.design_matrix).
+        """
+        self.technical_indicators_df()
+        X, Xy = design_matrix(
+            self.daily_data,
+            ["Open", "Close", "High", "Low", "Volume"],
+            seq_length,
+            blocks=[self.ta],
+            label=self.y,
+        )
+        return Xy
+
+    def feature_matrix(self, seq_length):
+        """
+        Sets the label y, the features and label Xy (read from the feature cache when there is one) and X.
+        Returns the feature spec.
+        """
         self.daily_data["Returns"] = pd.Series(
             (self.daily_data["Close"] / self.daily_data["Close"].shift(1) - 1) * 100,
             index=self.daily_data.index,
         )
-        seq_length = 3
         self.daily_data["Volume"] = self.daily_data["Volume"].astype(float)
-        self.X = self.daily_data[["Open", "Close", "High", "Low", "Volume"]]
         self.y = self.label(self.daily_data, seq_length)
-        X_shift = [self.X]
-        for i in range(1, seq_length):
-            X_shift.append(
-                self.daily_data[["Open", "Close", "High", "Low", "Volume"]].shift(i)
+        # lagged columns, indicators and label only depend on the bars and on the feature definitions
+        spec = {
+            "version": FEATURES_VERSION,
+            "seq_length": seq_length,
+            "indicators": [name for i in DEFAULT_INDICATORS for name in i.outputs],
+        }
+        if self.feature_cache is None:
+            self.Xy = self.features(seq_length)
+        else:
+            bars = self.daily_data[["Date", "Open", "Close", "High", "Low", "Volume"]]
+            self.Xy = self.feature_cache.get_or_build(
+                self.q, bars, spec, lambda: self.features(seq_length)
             )
-        ohlc = pd.concat(X_shift, axis=1)
-        ohlc.columns = sum(
-            [
-                [
-                    c + "T-{}".format(i)
-                    for c in ["Open", "Close", "High", "Low", "Volume"]
-                ]
-                for i in range(seq_length)
-            ],
-            [],
-        )
-        self.ta.index = ohlc.index
-        self.X = pd.concat([ohlc, self.ta], axis=1)
-        self.Xy = pd.concat([self.X, self.y], axis=1)
-
-        fs = FeatureSelector(data=self.X, labels=self.y)
-        fs.identify_all(
-            selection_params={
-                "missing_threshold": 0.6,
-                "correlation_threshold": 0.9,
-                "task": "regression",
-                "eval_metric": "auc",
-                "cumulative_importance": 0.99,
-            }
-        )
-        self.X_fs = fs.remove(methods="all", keep_one_hot=True)
+        self.X = split_design_matrix(self.Xy)
+        return spec
+
+    def preprocessing(self, n_jobs=None):
+        seq_length = 3
+        spec = self.feature_matrix(seq_length)
+
+        scope = plan_scope(self.q)
+        if self.selection_plans is not None:
+            self.selection_plan = self.selection_plans.valid_plan(
+                scope, self.q, self.X, SELECTION_PARAMS, spec
+            )
+        if self.selection_plan is not None:
+            print(
+                f"Reusing the feature selection of {self.selection_plan.source} ({scope}).\n"
+            )
+            self.X_fs = self.X[self.selection_plan.features]
+        else:
+            fs = FeatureSelector(data=self.X, labels=self.y)
+            fs.identify_all(
+                selection_params={
+                    **SELECTION_PARAMS,
+                    "n_jobs": n_jobs,
+                    "n_workers": FS_IMPORTANCE_WORKERS,
+                    "rank_tolerance": FS_RANK_TOLERANCE,
+                }
+            )
+            self.X_fs = fs.remove(methods="all", keep_one_hot=True)
+            if self.selection_plans is not None:
+                self.selection_plan = SelectionPlan.from_selector(
+                    fs, self.X_fs, SELECTION_PARAMS, spec, self.q
+                )
+                self.selection_plans.save(scope, self.selection_plan)
         self.Xy_fs = pd.concat([self.X_fs, self.y], axis=1)
 
+        # the last bars are the test set, shuffling would train on days after the ones tested
         X_train, X_test, y_train, y_test = train_test_split(
-            self.X_fs, self.y, test_size=0.2, random_state=42
+            self.X_fs, self.y, test_size=0.2, shuffle=False
         )
 
         return X_train, y_train, X_test, y_test
@@ -172,11 +217,13 @@ class Display:
 
 
 class XGB_training:
-    def __init__(self, Xtrain, ytrain, Xtest, ytest):
+    def __init__(self, Xtrain, ytrain, Xtest, ytest, n_jobs=None):
         self.Xtrain = Xtrain
         self.ytrain = ytrain
         self.Xtest = Xtest
         self.ytest = ytest
+        # XGBoost threads, None leaves it to XGBoost
+        self.n_jobs = n_jobs
         self._metric = ["logloss"]
         self.training()
 
@@ -215,59 +262,55 @@ class XGB_training:
 
     def training(self):
         """
-        Training is done at each max_depth loop.
-        XGBoost's cv is used to find the optimum number of tree (estimators) at each depth, up to 1000 trees.
+        Training is done for every candidate of XGB_SEARCH_SPACE (see hyperparameter_search.py).
+        XGBoost's cv is used to find the optimum number of tree (estimators) of each candidate, up to 1000 trees.
         Once traning result doesn't improve for 50 epochs, training will stop. The tree number used in the last epoch
         will be used to fit the train and test set again. Metrics will then be measured again this XGB model.
+        With XGB_HALVING_ETA set, candidates whose cv score is in the worst part of a rung are dropped early.
         """
 
-        max_depth = [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
-        best_depth = 0
-        best_estimator = 0
-        max_score = 0
-        for md in max_depth:
-            model = XGBClassifier(
-                learning_rate=0.3,
+        search = HyperparameterSearch(
+            base_params=dict(
                 n_estimators=1000,
-                max_depth=md,
                 min_child_weight=1,
                 gamma=1,
                 subsample=1,
-                colsample_bytree=0.1,
-                reg_lambda=0,
-                reg_alpha=1,
                 random_state=42,
+                n_jobs=self.n_jobs,
+            ),
+            space=XGB_SEARCH_SPACE,
+            num_boost_round=1000,
+            early_stopping_rounds=50,
+            nfold=8,
+            metric="auc",
+            seed=42,
+            n_workers=XGB_SEARCH_WORKERS,
+            n_jobs=self.n_jobs,
+            eta=XGB_HALVING_ETA,
+            max_bin=XGB_MAX_BIN,
+            chunk_rows=XGB_CHUNK_ROWS,
+            external_memory=XGB_EXTERNAL_MEMORY,
+        )
+        results = search.run(self.Xtrain, self.ytrain.values)
+        for rung in search.history[:-1]:
+            print(
+                "{} candidates cross-validated over {} rounds, {} kept.".format(
+                    len(rung), rung[0].rounds, math.ceil(len(rung) / search.eta)
+                )
             )
-            xgb_param = model.get_xgb_params()
-            xgtrain = xgboost.DMatrix(self.Xtrain.values, label=self.ytrain.values)
-
-            cvresult = xgboost.cv(
-                xgb_param,
-                xgtrain,
-                num_boost_round=1000,
-                early_stopping_rounds=50,
-                nfold=8,
-                metrics="auc",
-                stratified=True,
-                shuffle=True,
-                seed=42,
-                verbose_eval=False,
-            )
+
+        best_params = {}
+        best_estimator = 0
+        max_score = 0
+        for result in results:
             print(
                 "There are {} trees in the XGB model. CV-mean: {:.4f}, CV-std: {:.4f}.".format(
-                    cvresult.shape[0],
-                    cvresult.iloc[cvresult.shape[0] - 1, 0],
-                    cvresult.iloc[cvresult.shape[0] - 1, 1],
+                    result.n_trees, result.cv_mean, result.cv_std
                 )
             )
-            n = cvresult.shape[0]
-            model.set_params(n_estimators=n)
-            model.fit(
-                self.Xtrain,
-                self.ytrain,
-                eval_set=[(self.Xtrain, self.ytrain), (self.Xtest, self.ytest)],
-                verbose=False,
-            )
+            n = result.n_trees
+            # refit on the quantized training set the search already built
+            model = search.fit(result.params, n, self.Xtest.values, self.ytest.values)
             y_pred = model.predict(self.Xtest)
             score = accuracy_score(self.ytest, y_pred)
             mse = mean_squared_error(self.ytest, y_pred)
@@ -275,22 +318,22 @@ class XGB_training:
             if score > max_score:
                 max_score = score
                 min_mse = mse
-                best_depth = md
+                best_params = result.params
                 best_estimator = n
                 self.best_xgb = model
             print(
                 "Accuracy score: "
                 + str(round(score, 4))
-                + " at depth: "
-                + str(md)
+                + " at "
+                + str(result.params)
                 + " and estimator "
                 + str(n)
             )
             print(
                 "Mean square error: "
                 + str(round(mse, 4))
-                + " at depth: "
-                + str(md)
+                + " at "
+                + str(result.params)
                 + " and estimator "
                 + str(n)
             )
@@ -299,13 +342,18 @@ class XGB_training:
             + str(round(max_score, 4))
             + " Best MSE: "
             + str(round(min_mse, 4))
-            + " at depth: "
-            + str(best_depth)
+            + " at "
+            + str(best_params)
             + " and estimator of "
             + str(best_estimator)
         )
+        self.best_score = max_score
+        self.best_mse = min_mse
+        self.best_params = best_params
+        self.best_depth = best_params.get("max_depth")
+        self.best_estimator = best_estimator
 
-    def predict(self):
+    def predict(self, ticker=""):
         """
         Predicts the labels for the original test set
         """
@@ -329,14 +377,14 @@ class XGB_training:
             ax.plot(x_axis, results["validation_1"][m], label="Test")
             ax.legend()
             ax.set_ylabel(m)
-            plt.savefig("training.png", bbox_inches="tight")
+            plt.savefig(f"{ticker}training.png", bbox_inches="tight")
         # plt.show()
 
         # plot feature importances
         ax = xgboost.plot_importance(self.best_xgb.get_booster())
         fig = ax.figure
         fig.set_size_inches(14, 8)
-        plt.savefig("plot_importance.png", bbox_inches="tight")
+        plt.savefig(f"{ticker}plot_importance.png", bbox_inches="tight")
         # plt.show()
 
         # plot tree
@@ -346,7 +394,7 @@ class XGB_training:
             ax = xgboost.plot_tree(self.best_xgb.get_booster(), num_trees=3)
         fig = ax.figure
         fig.set_size_inches(8, 8)
-        plt.savefig("tree.png", bbox_inches="tight")
+        plt.savefig(f"{ticker}tree.png", bbox_inches="tight")
         # plt.show()
 
 
@@ -392,7 +440,7 @@ class FeatureSelector:
         Records the features that have a single unique value
 
     corr_matrix : dataframe
-        All correlations between all features in the data
+        All correlations between all features in the data, only built by `plot_collinear(plot_all=True)`
 
     record_collinear : dataframe
         Records the pairs of collinear variables with a correlation coefficient above the threshold
@@ -438,6 +486,7 @@ class FeatureSelector:
 
         self.missing_stats = None
         self.unique_stats = None
+        self.corr_data = None
         self.corr_matrix = None
         self.feature_importances = None
 
@@ -505,7 +554,9 @@ class FeatureSelector:
             "%d features with a single unique value.\n" % len(self.ops["single_unique"])
         )
 
-    def identify_collinear(self, correlation_threshold, one_hot=False):
+    def identify_collinear(
+        self, correlation_threshold, one_hot=False, block_size=DEFAULT_BLOCK_SIZE
+    ):
         """
         Finds collinear features based on the correlation coefficient between features.
         For each pair of features with a correlation coefficient greather than `correlation_threshold`,
@@ -522,12 +573,16 @@ class FeatureSelector:
         one_hot : boolean, default = False
             Whether to one-hot encode the features before calculating the correlation coefficients
 
+        block_size : int, default = 512
+            Correlations are computed (in float32) for block_size x block_size features at a time,
+            see correlation.py. The full correlation matrix is only built by `plot_collinear`
+
         """
 
         self.correlation_threshold = correlation_threshold
         self.one_hot_correlated = one_hot
 
-        # Calculate the correlations between every column
+        # Features to correlate
         if one_hot:
 
             # One hot encoding
@@ -543,54 +598,30 @@ class FeatureSelector:
                 [features[self.one_hot_features], self.data], axis=1
             )
 
-            corr_matrix = pd.get_dummies(features).corr()
+            corr_data = pd.get_dummies(features)
 
         else:
-            corr_matrix = self.data.corr()
-
-        self.corr_matrix = corr_matrix
+            corr_data = self.data
 
-        # Extract the upper triangle of the correlation matrix
-        upper = corr_matrix.where(np.triu(np.ones(corr_matrix.shape), k=1).astype(bool))
+        self.corr_data = corr_data
+        self.corr_matrix = None
 
-        # Select the features with correlations above the threshold
-        # Need to use the absolute value
-        to_drop = [
-            column
-            for column in upper.columns
-            if any(upper[column].abs() > correlation_threshold)
-        ]
+        # Pairs of columns (i before j) with a correlation magnitude above the threshold, j is dropped
+        i, j, corr_values = correlated_pairs(
+            corr_data.values, correlation_threshold, block_size
+        )
+        columns = np.asarray(corr_data.columns)
+        to_drop = list(columns[np.unique(j)])
 
-        # Dataframe to hold correlated pairs
+        # Dataframe holding the correlated pairs
         record_collinear = pd.DataFrame(
-            columns=["drop_feature", "corr_feature", "corr_value"]
+            {
+                "drop_feature": columns[j],
+                "corr_feature": columns[i],
+                "corr_value": corr_values.astype(np.float64),
+            }
         )
 
-        # Iterate through the columns to drop to record pairs of correlated features
-        for column in to_drop:
-            # Find the correlated features
-            corr_features = list(
-                upper.index[upper[column].abs() > correlation_threshold]
-            )
-
-            # Find the correlated values
-            corr_values = list(
-                upper[column][upper[column].abs() > correlation_threshold]
-            )
-            drop_features = [column for _ in range(len(corr_features))]
-
-            # Record the information (need a temp df for now)
-            temp_df = pd.DataFrame.from_dict(
-                {
-                    "drop_feature": drop_features,
-                    "corr_feature": corr_features,
-                    "corr_value": corr_values,
-                }
-            )
-
-            # Add to dataframe
-            record_collinear = record_collinear._append(temp_df, ignore_index=True)
-
         self.record_collinear = record_collinear
         self.ops["collinear"] = to_drop
 
@@ -600,7 +631,17 @@ class FeatureSelector:
         )
 
     def identify_zero_importance(
-        self, task, eval_metric=None, n_iterations=10, early_stopping=True
+        self,
+        task,
+        eval_metric=None,
+        n_iterations=10,
+        early_stopping=True,
+        n_jobs=None,
+        n_workers=1,
+        rank_tolerance=None,
+        patience=2,
+        min_iterations=3,
+        seed=None,
     ):
         """
 
@@ -626,6 +667,27 @@ class FeatureSelector:
         early_stopping : boolean, default = True
             Whether or not to use early stopping with a validation set when training
 
+        n_jobs : int, default = None
+            LightGBM threads, None leaves it to LightGBM. They are split between the workers
+
+        n_workers : int, default = 1
+            Number of iterations trained at the same time
+
+        rank_tolerance : float, default = None
+            Stop before `n_iterations` once the Spearman correlation between the importance ranks
+            averaged so far and the ranks one batch of iterations earlier stays above this value
+            for `patience` batches in a row (and the zero importance features did not change).
+            None always runs `n_iterations`
+
+        patience : int, default = 2
+            Number of stable batches in a row needed to stop early
+
+        min_iterations : int, default = 3
+            Iterations always run before stopping early
+
+        seed : int, default = None
+            Seed of the train / validation splits
+
 
         Notes
         --------
@@ -633,6 +695,8 @@ class FeatureSelector:
         - Features are one-hot encoded to handle the categorical variables before training.
         - The gbm is not optimized for any particular task and might need some hyperparameter tuning
         - Feature importances, including zero importance features, can change across runs
+        - The features are binned once into a LightGBM Dataset, every iteration trains on subsets of it
+        - Per iteration timings are kept in `importance_timings`
 
         """
 
@@ -645,6 +709,9 @@ class FeatureSelector:
         if self.labels is None:
             raise ValueError("No training labels provided.")
 
+        if task not in ["classification", "regression"]:
+            raise ValueError('Task must be either "classification" or "regression"')
+
         # One hot encoding
         features = pd.get_dummies(self.data)
         self.one_hot_features = [
@@ -658,54 +725,93 @@ class FeatureSelector:
         feature_names = list(features.columns)
 
         # Convert to np array
-        features = np.array(features)
+        features = np.asarray(features, dtype=np.float64)
         labels = np.array(self.labels).reshape((-1,))
 
-        # Empty array for feature importances
-        feature_importance_values = np.zeros(len(feature_names))
-
-        print("Training Gradient Boosting Model\n")
-
-        # Iterate through each fold
-        for _ in range(n_iterations):
-
-            if task == "classification":
-                model = lgb.LGBMClassifier(
-                    n_estimators=1000, learning_rate=0.05, verbose=0
-                )
-
-            elif task == "regression":
-                model = lgb.LGBMRegressor(
-                    n_estimators=1000, learning_rate=0.05, verbose=0
-                )
-
-            else:
-                raise ValueError('Task must be either "classification" or "regression"')
-
-            # If training using early stopping need a validation set
+        # Bin the features once, the iterations train on subsets sharing these bins
+        dataset = lgb.Dataset(features, label=labels, free_raw_data=False).construct()
+
+        n_workers = max(1, n_workers)
+        threads = None if n_jobs is None else max(1, n_jobs // n_workers)
+        params = {
+            "objective": "binary" if task == "classification" else "regression",
+            "learning_rate": 0.05,
+            "verbose": -1,
+        }
+        if threads is not None:
+            params["num_threads"] = threads
+        if early_stopping:
+            params["metric"] = eval_metric
+        rng = np.random.default_rng(seed)
+
+        def train(rows):
+            started = time.perf_counter()
             if early_stopping:
-
-                train_features, valid_features, train_labels, valid_labels = (
-                    train_test_split(features, labels, test_size=0.15)
-                )
-                # Train the model with early stopping
-                model.fit(
-                    train_features,
-                    train_labels,
-                    eval_metric=eval_metric,
-                    eval_set=[(valid_features, valid_labels)],
+                # 15 % of the rows are held out for early stopping
+                n_valid = int(np.ceil(0.15 * len(rows)))
+                train_set = dataset.subset(np.sort(rows[n_valid:]))
+                valid_set = dataset.subset(np.sort(rows[:n_valid]))
+                booster = lgb.train(
+                    params,
+                    train_set,
+                    num_boost_round=1000,
+                    valid_sets=[valid_set],
+                    callbacks=[lgb.early_stopping(100, verbose=False)],
                 )
-
-                # Clean up memory
-                gc.enable()
-                del train_features, train_labels, valid_features, valid_labels
-                gc.collect()
-
             else:
-                model.fit(features, labels)
+                booster = lgb.train(params, dataset, num_boost_round=1000)
+            importance = booster.feature_importance(importance_type="split")
+            return (
+                importance,
+                booster.current_iteration(),
+                time.perf_counter() - started,
+            )
+
+        print("Training Gradient Boosting Model\n")
 
-            # Record the feature importances
-            feature_importance_values += model.feature_importances_ / n_iterations
+        importance_sum = np.zeros(len(feature_names))
+        previous_ranks = None
+        stable = 0
+        timings = []
+        with ThreadPoolExecutor(n_workers) as executor:
+            while len(timings) < n_iterations:
+                batch = min(n_workers, n_iterations - len(timings))
+                splits = [rng.permutation(len(labels)) for _ in range(batch)]
+                for importance, n_trees, seconds in executor.map(train, splits):
+                    importance_sum += importance
+                    timings.append(
+                        {
+                            "iteration": len(timings),
+                            "seconds": seconds,
+                            "n_trees": n_trees,
+                        }
+                    )
+
+                ranks = pd.Series(importance_sum).rank().values
+                if rank_tolerance is not None and previous_ranks is not None:
+                    same_zeros = np.array_equal(importance_sum == 0, previous_zeros)
+                    if (
+                        same_zeros
+                        and np.corrcoef(ranks, previous_ranks)[0, 1] >= rank_tolerance
+                    ):
+                        stable += 1
+                    else:
+                        stable = 0
+                    if stable >= patience and len(timings) >= min_iterations:
+                        break
+                previous_ranks = ranks
+                previous_zeros = importance_sum == 0
+
+        self.importance_timings = pd.DataFrame(timings)
+        feature_importance_values = importance_sum / len(timings)
+        print(
+            "%d iterations trained in %.2f seconds (%.2f seconds per iteration).\n"
+            % (
+                len(timings),
+                self.importance_timings["seconds"].sum(),
+                self.importance_timings["seconds"].mean(),
+            )
+        )
 
         feature_importances = pd.DataFrame(
             {"feature": feature_names, "importance": feature_importance_values}
@@ -800,6 +906,8 @@ class FeatureSelector:
         selection_params : dict
            Parameters to use in the five feature selection methhods.
            Params must contain the keys ['missing_threshold', 'correlation_threshold', 'eval_metric', 'task', 'cumulative_importance']
+           and may contain 'n_jobs', the number of LightGBM threads, and the 'n_workers', 'rank_tolerance'
+           and 'seed' of `identify_zero_importance`
 
         """
 
@@ -819,7 +927,12 @@ class FeatureSelector:
         self.identify_single_unique()
         self.identify_collinear(selection_params["correlation_threshold"])
         self.identify_zero_importance(
-            task=selection_params["task"], eval_metric=selection_params["eval_metric"]
+            task=selection_params["task"],
+            eval_metric=selection_params["eval_metric"],
+            n_jobs=selection_params.get("n_jobs"),
+            n_workers=selection_params.get("n_workers", 1),
+            rank_tolerance=selection_params.get("rank_tolerance"),
+            seed=selection_params.get("seed"),
         )
         self.identify_low_importance(selection_params["cumulative_importance"])
 
@@ -1002,16 +1115,19 @@ class FeatureSelector:
             )
 
         if plot_all:
+            if self.corr_matrix is None:
+                self.corr_matrix = correlation_frame(self.corr_data)
             corr_matrix_plot = self.corr_matrix
             title = "All Correlations"
 
         else:
             # Identify the correlations that were above the threshold
             # columns (x-axis) are features to drop and rows (y_axis) are correlated pairs
-            corr_matrix_plot = self.corr_matrix.loc[
+            corr_matrix_plot = correlation_frame(
+                self.corr_data,
                 list(set(self.record_collinear["corr_feature"])),
                 list(set(self.record_collinear["drop_feature"])),
-            ]
+            )
 
             title = "Correlations Above Threshold"
 
@@ -1124,63 +1240,98 @@ class FeatureSelector:
 
 
 # ----------------------------- MAIN PROGRAM ---------------------------------
-def main():
+def train_ticker(symbol, feature_cache=None, selection_plans=None, n_jobs=None):
+    """
+    Preprocessing, feature selection, plots and XGBoost training of one ticker,
+    returns its summary row. `n_jobs` caps the XGBoost and LightGBM threads.
+    With `selection_plans`, a still valid stored feature selection is reused.
+    """
+    print("\n")
+    print(
+        "##################### Gradient Boosting Classification by XGBoost on stock data ##########################"
+    )
+    print("\n")
+    # Set the print canvas right
+    pd.set_option("display.float_format", lambda x: "%.2f" % x)
+    pd.set_option("display.max_columns", 14)
+    pd.set_option("display.width", 1600)
+
+    print(
+        "*********************************************  Data Preprocessing ***************************************"
+    )
+    print("\n")
+    stock_data = Data(
+        symbol, feature_cache=feature_cache, selection_plans=selection_plans
+    )
+    print("\n")
+    print("Preprocessing and selecting features ...")
+    print("\n")
+    X_train, y_train, X_test, y_test = stock_data.preprocessing(n_jobs=n_jobs)
+    X, y, Xy, Xy_fs = stock_data.X, stock_data.y, stock_data.Xy, stock_data.Xy_fs
+    print("\n")
+    print("Original features >")
+    print(Xy.info())
+    print("\n")
+    print("Selected features >")
+    print(Xy_fs.info())
+    print("\n")
+
+    plot = Display(Xy, Xy_fs)
+    plot.features_histograms(symbol)
+    plot.plot_corr_heatmap(symbol)
+    plot.plot_corr_heatmap_fs(symbol)
+
+    print(
+        "******************************************  Model training and tuning ************************************"
+    )
+    print("\n")
+
+    # Training Decision Tree & Random Forest model to get the best model and its hyperparameters:
+    xgb_clf = XGB_training(X_train, y_train, X_test, y_test, n_jobs=n_jobs)
+    xgb_clf.predict(symbol)
+    # figures are kept by pyplot until closed, a worker trains many tickers
+    plt.close("all")
+
+    return {
+        "symbol": symbol,
+        "n_bars": len(stock_data.daily_data),
+        "n_features": X.shape[1],
+        "n_selected": stock_data.X_fs.shape[1],
+        "selected_by": (
+            stock_data.selection_plan.source if stock_data.selection_plan else symbol
+        ),
+        "best_params": xgb_clf.best_params,
+        "best_depth": xgb_clf.best_depth,
+        "best_estimator": xgb_clf.best_estimator,
+        "accuracy": xgb_clf.best_score,
+        "mse": xgb_clf.best_mse,
+    }
+
+
+def main(n_workers=TRAIN_WORKERS):
     """
     The main program
     """
 
-    for ticker in target_list:
-        print("\n")
-        print(
-            "##################### Gradient Boosting Classification by XGBoost on stock data ##########################"
-        )
-        print("\n")
-        # Set the print canvas right
-        pd.set_option("display.float_format", lambda x: "%.2f" % x)
-        pd.set_option("display.max_columns", 14)
-        pd.set_option("display.width", 1600)
-
-        print(
-            "*********************************************  Data Preprocessing ***************************************"
-        )
-        print("\n")
-        symbol = ticker
-        stock_data = Data(symbol)
-        print("\n")
-        print("Preprocessing and selecting features ...")
-        print("\n")
-        X_train, y_train, X_test, y_test = stock_data.preprocessing()
-        X, y, Xy, Xy_fs = stock_data.X, stock_data.y, stock_data.Xy, stock_data.Xy_fs
-        print("\n")
-        print("Original features >")
-        print(Xy.info())
-        print("\n")
-        print("Selected features >")
-        print(Xy_fs.info())
-        print("\n")
-
-        plot = Display(Xy, Xy_fs)
-        plot.features_histograms(symbol)
-        plot.plot_corr_heatmap(symbol)
-        plot.plot_corr_heatmap_fs(symbol)
-
-        print(
-            "******************************************  Model training and tuning ************************************"
-        )
-        print("\n")
-
-        # Training Decision Tree & Random Forest model to get the best model and its hyperparameters:
-        xgb_clf = XGB_training(X_train, y_train, X_test, y_test)
-        xgb_clf.predict()
-
-        print("\n")
-        print(
-            "All plots are saved with relevant filenames in the same folder as this program, feel free to review after this program ends."
-        )
-        print("\n")
-        print(
-            "#########################################   END OF PROGRAM   ##############################################"
-        )
+    trainer = ParallelTrainer(
+        train_ticker,
+        n_workers=n_workers,
+        threads_per_worker=TRAIN_THREADS_PER_WORKER,
+        summary_path=TRAIN_SUMMARY,
+        feature_cache=FeatureCache(),
+        selection_plans=SelectionPlans(),
+    )
+    summary = trainer.run(target_list)
+
+    print("\n")
+    print(summary.to_string())
+    print(
+        "All plots are saved with relevant filenames in the same folder as this program, feel free to review after this program ends."
+    )
+    print("\n")
+    print(
+        "#########################################   END OF PROGRAM   ##############################################"
+    )
 
 
 if __name__ == "__main__":
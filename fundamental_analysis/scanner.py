@@ -0,0 +1,182 @@
+import random
+import threading
+import time
+from asyncio.log import logger
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from yfinance.exceptions import YFRateLimitError
+
+"""
+Concurrent universe scan.
+
+Yahoo throttles by request rate rather than by number of open connections, so the scan
+is driven by a token bucket shared by all workers instead of a fixed sleep per symbol.
+Each exchange additionally gets its own concurrency cap so a long run of dead Shenzhen
+codes cannot crowd out everything else.
+"""
+
+
+class EmptyResult(Exception):
+    """
+    Raised by a fetcher when yahoo returned nothing for a ticker that is listed.
+    Yahoo answers a throttled or failed request with an empty frame, so the result cannot be trusted.
+    """
+
+
+class TokenBucket:
+    """
+    Thread safe token bucket: `rate` tokens are added per second up to `capacity`,
+    `acquire` blocks until a token is available.
+    """
+
+    def __init__(self, rate, capacity=None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else max(1.0, rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self, tokens=1):
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait_time = (tokens - self._tokens) / self.rate
+            time.sleep(wait_time)
+
+
+def exchange_of(ticker):
+    """
+    Exchange code of a yahoo ticker: 000333.SZ -> SZ, 0700.HK -> HK.
+    Codes without a suffix (S&P 500 names, the bare B share codes) are grouped as US.
+    """
+    if "." in ticker:
+        return ticker.rsplit(".", 1)[1].upper()
+    return "US"
+
+
+class UniverseScanner:
+    """
+    Runs `fetcher(ticker)` over a ticker iterable on a bounded thread pool.
+
+    Parameters
+    --------
+        fetcher : callable
+            Called with a single ticker and returns whatever the caller wants back, e.g. the
+            output of Stock_Info.roe_filter. Replace it with a local stub to scan without Yahoo.
+        rate : float
+            Maximum number of fetcher calls started per second across all workers
+        burst : int
+            Token bucket capacity, i.e. how many calls may start back to back
+        max_workers : int
+            Size of the thread pool
+        exchange_limits : dict
+            Maximum number of in-flight calls per exchange (see `exchange_of`), default_limit otherwise
+        retries : int
+            Number of extra attempts when the fetcher raises one of `retry_on`
+        backoff : float
+            Base delay in seconds of the exponential backoff between attempts
+        retry_on : tuple of exception types
+            Errors worth retrying: network errors, yahoo rate limits and EmptyResult, which fetchers
+            raise when a listed ticker came back empty. Anything else is reported straight away.
+    """
+
+    def __init__(
+        self,
+        fetcher,
+        rate=2.0,
+        burst=5,
+        max_workers=8,
+        exchange_limits=None,
+        default_limit=4,
+        retries=3,
+        backoff=1.0,
+        retry_on=(OSError, YFRateLimitError, EmptyResult),
+    ):
+        self.fetcher = fetcher
+        self.bucket = TokenBucket(rate, burst)
+        self.max_workers = max_workers
+        self.exchange_limits = dict(exchange_limits or {})
+        self.default_limit = default_limit
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_on = tuple(retry_on)
+        self._semaphores = {}
+        self._semaphores_lock = threading.Lock()
+
+        # Simple counters for reporting
+        self.n_calls = 0
+        self.n_retries = 0
+        self._counter_lock = threading.Lock()
+
+    def _semaphore(self, exchange):
+        with self._semaphores_lock:
+            if exchange not in self._semaphores:
+                limit = self.exchange_limits.get(exchange, self.default_limit)
+                self._semaphores[exchange] = threading.BoundedSemaphore(limit)
+            return self._semaphores[exchange]
+
+    def _fetch_with_retry(self, ticker):
+        with self._semaphore(exchange_of(ticker)):
+            attempt = 0
+            while True:
+                self.bucket.acquire()
+                with self._counter_lock:
+                    self.n_calls += 1
+                try:
+                    return self.fetcher(ticker)
+                except self.retry_on as e:
+                    if attempt >= self.retries:
+                        raise
+                    delay = self.backoff * (2**attempt) * (1 + random.random())
+                    logger.info(f"{ticker} failed with {e}, retrying in {delay:.1f}s")
+                    with self._counter_lock:
+                        self.n_retries += 1
+                    attempt += 1
+                    time.sleep(delay)
+
+    def scan(self, tickers):
+        """
+        Generator of (ticker, result, error) in completion order, error is None on success.
+        At most 2 * max_workers tickers are pulled from `tickers` ahead of the results,
+        so the ticker generators are never materialised.
+        """
+        started = time.monotonic()
+        n_done = 0
+        tickers = iter(tickers)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending = {}
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < 2 * self.max_workers:
+                    try:
+                        ticker = next(tickers)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending[executor.submit(self._fetch_with_retry, ticker)] = ticker
+                if not pending:
+                    break
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    ticker = pending.pop(future)
+                    n_done += 1
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        yield ticker, None, e
+                    else:
+                        yield ticker, result, None
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"scanned {n_done} tickers in {elapsed:.1f}s with {self.n_calls} calls and {self.n_retries} retries"
+        )
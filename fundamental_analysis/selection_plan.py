@@ -0,0 +1,211 @@
+import json
+import os
+import time
+from asyncio.log import logger
+
+import numpy as np
+
+from config import SELECTION_DRIFT_THRESHOLD, SELECTION_PLAN_DIR
+from config import SELECTION_PLAN_GROUPS, SELECTION_PLAN_SCOPE
+from scanner import exchange_of
+
+"""
+Persisted feature selection decisions of run_forest.Data, so retrains can skip FeatureSelector.
+
+A plan records the features kept by FeatureSelector.identify_all, the selection thresholds and
+feature spec it ran with, and a fingerprint of the data it saw. Plans are json files under `root`,
+one per scope: by default the ticker itself. Tickers can be made to pool a plan through their
+exchange or the group given to them in config.SELECTION_PLAN_GROUPS (e.g. a sector), the features
+kept for one of them are then used for all of them.
+
+A stored plan is reused as long as the thresholds, the spec and the feature columns are the same and
+the ticker's data did not drift further than `drift_threshold` from its own fingerprint, which is kept
+under `root`/fingerprints whatever the scope. Features of different tickers sit at different levels
+and are not compared with each other: a ticker adopting a pooled plan for the first time takes it
+as it is, and its fingerprint is recorded then.
+
+Drift is the median over the features of the population stability index of the feature against
+the deciles recorded in the fingerprint.
+"""
+
+N_BINS = 10
+
+
+def _bin_fractions(column, edges):
+    """Fractions of the values of `column` in each bin between `edges`, then the missing fraction."""
+    present = column[~np.isnan(column)]
+    counts = np.bincount(
+        np.searchsorted(edges, present, side="right"), minlength=len(edges) + 1
+    )
+    return np.append(counts, len(column) - len(present)) / max(1, len(column))
+
+
+def fingerprint(X):
+    """Decile edges and bin fractions of every column of the DataFrame X."""
+    values = np.asarray(X.values, dtype=np.float64)
+    edges, fractions = [], []
+    for k in range(values.shape[1]):
+        column = values[:, k]
+        present = column[~np.isnan(column)]
+        column_edges = (
+            np.unique(np.quantile(present, np.arange(1, N_BINS) / N_BINS))
+            if len(present)
+            else np.empty(0)
+        )
+        edges.append(column_edges.tolist())
+        fractions.append(_bin_fractions(column, column_edges).tolist())
+    return {
+        "columns": list(X.columns),
+        "n_rows": len(X),
+        "edges": edges,
+        "fractions": fractions,
+    }
+
+
+def drift(reference, X):
+    """Median population stability index of the columns of X against the fingerprint `reference`."""
+    values = np.asarray(X.values, dtype=np.float64)
+    psi = []
+    for k in range(values.shape[1]):
+        expected = np.asarray(reference["fractions"][k])
+        actual = _bin_fractions(values[:, k], np.asarray(reference["edges"][k]))
+        # empty bins would make the index infinite
+        expected, actual = np.maximum(expected, 1e-4), np.maximum(actual, 1e-4)
+        psi.append(np.sum((actual - expected) * np.log(actual / expected)))
+    return float(np.median(psi)) if psi else 0.0
+
+
+def plan_scope(symbol, scope=SELECTION_PLAN_SCOPE, groups=SELECTION_PLAN_GROUPS):
+    """Name of the plan `symbol` uses: its group, its exchange or itself."""
+    if symbol in groups:
+        return f"group-{groups[symbol]}"
+    if scope == "exchange":
+        return f"exchange-{exchange_of(symbol)}"
+    return f"ticker-{symbol}"
+
+
+class SelectionPlan:
+    """
+    Parameters
+    --------
+        features : list
+            Columns kept by the selection
+        removed : dict
+            FeatureSelector operation -> columns it removed
+        params : dict
+            Selection thresholds
+        spec : dict
+            Feature spec of the columns (see run_forest.Data.preprocessing)
+        fingerprint : dict
+            See `fingerprint`
+        source : str
+            Ticker the selection ran on
+    """
+
+    def __init__(
+        self, features, removed, params, spec, fingerprint, source, created=None
+    ):
+        self.features = features
+        self.removed = removed
+        self.params = params
+        self.spec = spec
+        self.fingerprint = fingerprint
+        self.source = source
+        self.created = created if created is not None else time.time()
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, state):
+        return cls(**state)
+
+    @classmethod
+    def from_selector(cls, selector, X_selected, params, spec, source):
+        """The plan of a FeatureSelector which ran identify_all, `X_selected` being what it kept."""
+        removed = {
+            op: [str(c) for c in columns] for op, columns in selector.ops.items()
+        }
+        return cls(
+            list(X_selected.columns),
+            removed,
+            params,
+            spec,
+            fingerprint(selector.data),
+            source,
+        )
+
+
+class SelectionPlans:
+
+    def __init__(
+        self, root=SELECTION_PLAN_DIR, drift_threshold=SELECTION_DRIFT_THRESHOLD
+    ):
+        self.root = root
+        self.drift_threshold = drift_threshold
+        os.makedirs(os.path.join(root, "fingerprints"), exist_ok=True)
+
+    def _path(self, scope):
+        return os.path.join(self.root, f"{scope}.json")
+
+    def _fingerprint_path(self, symbol):
+        return os.path.join(self.root, "fingerprints", f"{symbol}.json")
+
+    @staticmethod
+    def _write(path, state):
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f, default=str)
+        os.replace(tmp, path)
+
+    def load(self, scope):
+        try:
+            with open(self._path(scope)) as f:
+                return SelectionPlan.from_dict(json.load(f))
+        except FileNotFoundError:
+            return None
+
+    def load_fingerprint(self, symbol):
+        try:
+            with open(self._fingerprint_path(symbol)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save_fingerprint(self, symbol, X):
+        self._write(self._fingerprint_path(symbol), fingerprint(X))
+
+    def save(self, scope, plan):
+        self._write(self._path(scope), plan.to_dict())
+        self._write(self._fingerprint_path(plan.source), plan.fingerprint)
+
+    def valid_plan(self, scope, symbol, X, params, spec):
+        """The stored plan of `scope` if it still applies to the features X of `symbol`, None otherwise."""
+        plan = self.load(scope)
+        if plan is None:
+            return None
+        # json turns tuples into lists, compare both sides the same way
+        same = json.loads(json.dumps([params, spec], default=str)) == [
+            plan.params,
+            plan.spec,
+        ]
+        if not same:
+            logger.info(
+                f"{scope}: selection plan made with other thresholds or features"
+            )
+            return None
+        if plan.fingerprint["columns"] != list(X.columns):
+            logger.info(f"{scope}: selection plan made for other feature columns")
+            return None
+        reference = self.load_fingerprint(symbol)
+        if reference is None or reference["columns"] != list(X.columns):
+            # first use of a pooled plan, later runs of the ticker are compared with this one
+            self.save_fingerprint(symbol, X)
+            return plan
+        score = drift(reference, X)
+        if score > self.drift_threshold:
+            logger.info(
+                f"{symbol}: data drifted ({score:.3f}) since its selection plan"
+            )
+            return None
+        return plan
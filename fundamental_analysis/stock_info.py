@@ -1,6 +1,44 @@
 import math
+
+import numpy as np
 import yfinance as yf
 
+# share count history used for the dilution check of the piotroski score
+SHARES_START = "2023-09-01"
+SHARES_STATEMENT = f"shares_full_{SHARES_START}"
+
+
+class Statement:
+    """
+    Compact copy of a yahoo financial statement: line item -> numpy array of values by fiscal period,
+    latest period first. Lookups mirror `statement.iloc[:, period][item]` (KeyError on a missing line item)
+    and `statement.iloc[:, period].get(item)` (None on a missing line item).
+    """
+
+    def __init__(self, df):
+        self.periods = list(df.columns)
+        values = df.to_numpy(dtype=float, na_value=np.nan)
+        self.items = {str(item): values[i] for i, item in enumerate(df.index)}
+
+    @property
+    def n_periods(self):
+        return len(self.periods)
+
+    def _check_period(self, period):
+        if period >= self.n_periods:
+            raise IndexError(
+                f"period {period} out of range for {self.n_periods} periods"
+            )
+
+    def value(self, item, period=0):
+        self._check_period(period)
+        return self.items[item][period]
+
+    def get(self, item, period=0):
+        self._check_period(period)
+        values = self.items.get(item)
+        return None if values is None else values[period]
+
 
 class Stock_Info:
     """
@@ -10,9 +48,69 @@ class Stock_Info:
     Buffett attached great importance to the ROE indicator
     """
 
-    def __init__(self, ticker):
+    def __init__(self, ticker, store=None):
         self._ticker = yf.Ticker(ticker)
         self.ticker_name = ticker
+        # optional FundamentalsStore, statements come straight from yahoo without it
+        self._store = store
+        # each statement is loaded once per instance, fetch_count is the number of underlying loads
+        self._statements = {}
+        self._shares = {}
+        self.fetch_count = 0
+        self.last_score_fetches = None
+
+    def _statement(self, name, force=False):
+        if force or name not in self._statements:
+            if self._store is None:
+                df = getattr(self._ticker, name)
+            else:
+                df = self._store.get(
+                    self.ticker_name, name, lambda: getattr(self._ticker, name), force
+                )
+            self.fetch_count += 1
+            self._statements[name] = Statement(df)
+        return self._statements[name]
+
+    @property
+    def income_stmt(self):
+        return self._statement("income_stmt")
+
+    @property
+    def balance_sheet(self):
+        return self._statement("balance_sheet")
+
+    @property
+    def cash_flow(self):
+        return self._statement("cash_flow")
+
+    def get_shares_full(self, start, force=False):
+        if force or start not in self._shares:
+            if self._store is None:
+                shares = self._ticker.get_shares_full(start)
+            else:
+                shares = self._store.get_series(
+                    self.ticker_name,
+                    f"shares_full_{start}",
+                    lambda: self._ticker.get_shares_full(start),
+                    force,
+                )
+            self.fetch_count += 1
+            self._shares[start] = shares
+        return self._shares[start]
+
+    def has_prices(self):
+        """Whether yahoo has daily bars of the ticker over the last month, i.e. the code is listed."""
+        return not self._ticker.history(period="1mo").empty
+
+    def prefetch(self, force=False):
+        """
+        Load every statement the scores need, returns the number of underlying loads.
+        `force` downloads them again even when the store holds a fresh copy.
+        """
+        for name in ("income_stmt", "balance_sheet", "cash_flow"):
+            self._statement(name, force)
+        self.get_shares_full(SHARES_START, force)
+        return self.fetch_count
 
     def piotroski_score(self):
         """
@@ -38,37 +136,35 @@ class Stock_Info:
         If the score adds up to between 0-2 points, the stock is considered weak
         """
 
-        return (
+        fetches_before = self.fetch_count
+        score = (
             self.get_p_profitability_score()
             + self.get_p_liquidity_score()
             + self.get_p_operating_efficiency()
         )
+        self.last_score_fetches = self.fetch_count - fetches_before
+        return score
 
     def yearly_dividend(self, year):
         dividends = self._ticker.dividends.resample("YE").sum()
         return dividends.loc[year].values[year]
 
     def latest_net_income(self):
-        income_statement = self._ticker.income_stmt
-        net_income = income_statement.iloc[:, 0]["Net Income"]
-        return net_income
+        return self.income_stmt.value("Net Income")
 
     def latest_operating_cash_flow(self):
-        cash_statement = self._ticker.cash_flow
-        operating_cash_flow = cash_statement.iloc[:, 0]["Operating Cash Flow"]
-        return operating_cash_flow
+        return self.cash_flow.value("Operating Cash Flow")
 
     def latest_return_on_asset(self):
-        balance_sheet = self._ticker.balance_sheet
-        total_asset = balance_sheet.iloc[:, 0]["Total Assets"]
+        total_asset = self.balance_sheet.value("Total Assets")
         return self.latest_net_income() / total_asset
 
     def current_ratio_comparator(self):
-        balance_sheet = self._ticker.balance_sheet
-        latest_current_assets = balance_sheet.iloc[:, 0].get("Current Assets")
-        latest_current_liabilities = balance_sheet.iloc[:, 0].get("Current Liabilities")
-        prev_current_assets = balance_sheet.iloc[:, 1].get("Current Assets")
-        prev_current_liabilities = balance_sheet.iloc[:, 1].get("Current Liabilities")
+        balance_sheet = self.balance_sheet
+        latest_current_assets = balance_sheet.get("Current Assets", 0)
+        latest_current_liabilities = balance_sheet.get("Current Liabilities", 0)
+        prev_current_assets = balance_sheet.get("Current Assets", 1)
+        prev_current_liabilities = balance_sheet.get("Current Liabilities", 1)
         if (
             latest_current_assets
             and latest_current_liabilities
@@ -88,18 +184,20 @@ class Stock_Info:
 
     def get_p_profitability_score(self):
         s = 0
-        if self.latest_net_income() > 1:
+        net_income = self.latest_net_income()
+        operating_cash_flow = self.latest_operating_cash_flow()
+        if net_income > 1:
             s += 1
-        if self.latest_operating_cash_flow() > 1:
+        if operating_cash_flow > 1:
             s += 1
         if self.latest_return_on_asset() > 1:
             s += 1
-        if self.latest_operating_cash_flow() > self.latest_net_income():
+        if operating_cash_flow > net_income:
             s += 1
         return s
 
     def shares_diluted_or_not(self):
-        current_shares = self._ticker.get_shares_full("2023-09-01")
+        current_shares = self.get_shares_full(SHARES_START)
         try:
             if current_shares:
                 shares_one_year_ago = current_shares.iloc[0]
@@ -112,15 +210,15 @@ class Stock_Info:
             return False
 
     def higher_gross_margin_or_not(self):
-        income_statement = self._ticker.income_stmt
-        c_sales = income_statement.iloc[:, 0]["Total Revenue"]
-        c_cogs = income_statement.iloc[:, 0].get("Cost of Revenue")
+        income_statement = self.income_stmt
+        c_sales = income_statement.value("Total Revenue", 0)
+        c_cogs = income_statement.get("Cost of Revenue", 0)
         if c_cogs:
             c_gross_margin = (c_sales - c_cogs) / c_cogs
         else:
             return 0
-        p_sales = income_statement.iloc[:, 1]["Total Revenue"]
-        p_cogs = income_statement.iloc[:, 1]["Cost of Revenue"]
+        p_sales = income_statement.value("Total Revenue", 1)
+        p_cogs = income_statement.value("Cost of Revenue", 1)
         p_gross_margin = (p_sales - p_cogs) / p_cogs
         print(
             f"current gross margin: {c_gross_margin} previous gross margin:{p_gross_margin}"
@@ -128,13 +226,13 @@ class Stock_Info:
         return c_gross_margin > p_gross_margin
 
     def higher_asset_turnover_ratio_or_not(self):
-        income_statement = self._ticker.income_stmt
-        c_sales = income_statement.iloc[:, 0]["Total Revenue"]
-        p_sales = income_statement.iloc[:, 1]["Total Revenue"]
-        balance_sheet = self._ticker.balance_sheet
-        c_total_asset = balance_sheet.iloc[:, 0]["Total Assets"]
-        p_total_asset = balance_sheet.iloc[:, 1]["Total Assets"]
-        pp_total_asset = balance_sheet.iloc[:, 2]["Total Assets"]
+        income_statement = self.income_stmt
+        c_sales = income_statement.value("Total Revenue", 0)
+        p_sales = income_statement.value("Total Revenue", 1)
+        balance_sheet = self.balance_sheet
+        c_total_asset = balance_sheet.value("Total Assets", 0)
+        p_total_asset = balance_sheet.value("Total Assets", 1)
+        pp_total_asset = balance_sheet.value("Total Assets", 2)
 
         c_asset_turnover_ratio = 2 * c_sales / (c_total_asset + p_total_asset)
         p_asset_turnover_ratio = 2 * p_sales / (c_total_asset + p_total_asset)
@@ -145,15 +243,15 @@ class Stock_Info:
 
     def get_p_liquidity_score(self):
         s = 0
-        balance_sheet = self._ticker.balance_sheet
-        current_long_deb = balance_sheet.iloc[:, 0].get("Long Term Debt")
-        pre_long_deb = balance_sheet.iloc[:, 1].get("Long Term Debt")
+        balance_sheet = self.balance_sheet
+        current_long_deb = balance_sheet.get("Long Term Debt", 0)
+        pre_long_deb = balance_sheet.get("Long Term Debt", 1)
         if not current_long_deb or pre_long_deb:
-            current_long_deb = balance_sheet.iloc[:, 0].get(
-                "Long Term Debt And Capital Lease Obligation"
+            current_long_deb = balance_sheet.get(
+                "Long Term Debt And Capital Lease Obligation", 0
             )
-            pre_long_deb = balance_sheet.iloc[:, 1].get(
-                "Long Term Debt And Capital Lease Obligation"
+            pre_long_deb = balance_sheet.get(
+                "Long Term Debt And Capital Lease Obligation", 1
             )
         if current_long_deb and pre_long_deb:
             if current_long_deb < pre_long_deb:
@@ -174,15 +272,17 @@ class Stock_Info:
         return s
 
     def roe_filter(self, average_roe_requriement, min_roe_requirement):
-        income_statement = self._ticker.income_stmt
-        balance_sheet = self._ticker.balance_sheet
-        row_num = income_statement.shape[1]
+        income_statement = self.income_stmt
+        balance_sheet = self.balance_sheet
+        net_incomes = income_statement.items["Net Income"]
+        common_stock_equities = balance_sheet.items["Common Stock Equity"]
+        row_num = income_statement.n_periods
         roe_sum = 0
         n = 0
         for i in range(row_num):
-            net_income = income_statement.iloc[:, i]["Net Income"]
+            net_income = net_incomes[i]
             if not math.isnan(net_income):
-                common_stock_equity = balance_sheet.iloc[:, i]["Common Stock Equity"]
+                common_stock_equity = common_stock_equities[i]
                 roe = net_income / common_stock_equity
                 if roe < min_roe_requirement:
                     print(
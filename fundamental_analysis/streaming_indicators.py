@@ -0,0 +1,426 @@
+import json
+import math
+import sqlite3
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+"""
+Bar by bar versions of the indicators.py calculations, for daily (and later intraday) updates.
+
+Every indicator keeps only what the next bar needs (running sums, the last smoothed values,
+a window for the moving averages), so an update is O(1) per bar and gives the numbers of the
+batch path (talib) on the same history. The state of every indicator is plain json, it is
+checkpointed per symbol by IndicatorCheckpoints and resumed on the next run.
+"""
+
+NAN = float("nan")
+
+
+class StreamingIndicator:
+    # attributes holding deques, they are stored as lists in the checkpoint
+    buffers = ()
+    # attributes holding other indicators, by class
+    children = {}
+
+    def state(self):
+        state = dict(self.__dict__)
+        for key in self.buffers:
+            state[key] = list(state[key])
+        for key in self.children:
+            state[key] = state[key].state()
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        indicator = cls.__new__(cls)
+        indicator.__dict__.update(state)
+        for key in cls.buffers:
+            indicator.__dict__[key] = deque(state[key], maxlen=state["period"])
+        for key, child in cls.children.items():
+            indicator.__dict__[key] = child.from_state(state[key])
+        return indicator
+
+
+class SMA(StreamingIndicator):
+    buffers = ("window",)
+
+    def __init__(self, period):
+        self.period = period
+        self.window = deque(maxlen=period)
+        self.total = 0.0
+
+    def update(self, x):
+        if len(self.window) == self.period:
+            self.total -= self.window[0]
+        self.window.append(x)
+        self.total += x
+        return self.total / self.period if len(self.window) == self.period else NAN
+
+
+class EMA(StreamingIndicator):
+    """Seeded with the mean of the first `period` values, as talib EMA."""
+
+    def __init__(self, period):
+        self.period = period
+        self.k = 2.0 / (period + 1)
+        self.n = 0
+        self.seed = 0.0
+        self.value = NAN
+
+    def update(self, x):
+        self.n += 1
+        if self.n < self.period:
+            self.seed += x
+            return NAN
+        if self.n == self.period:
+            self.value = (self.seed + x) / self.period
+        else:
+            self.value = x * self.k + self.value * (1 - self.k)
+        return self.value
+
+
+class Wilder(StreamingIndicator):
+    """Wilder smoothing seeded with the mean of the first `period` values (indicators.wilder_panel)."""
+
+    def __init__(self, period):
+        self.period = period
+        self.n = 0
+        self.seed = 0.0
+        self.value = NAN
+
+    def update(self, x):
+        self.n += 1
+        if self.n < self.period:
+            self.seed += x
+            return NAN
+        if self.n == self.period:
+            self.value = (self.seed + x) / self.period
+        else:
+            self.value = (self.value * (self.period - 1) + x) / self.period
+        return self.value
+
+
+class MACD(StreamingIndicator):
+    """
+    MACD line aligned as talib MACD: the fast average is seeded with the `fast` closes ending at
+    the first full slow window, and the line is reported once its signal average would be.
+    """
+
+    buffers = ("window",)
+
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.period = slow
+        self.fast = fast
+        self.signal = signal
+        self.k_fast = 2.0 / (fast + 1)
+        self.k_slow = 2.0 / (slow + 1)
+        self.window = deque(maxlen=slow)
+        self.n = 0
+        self.fast_value = NAN
+        self.slow_value = NAN
+
+    def update(self, x):
+        self.n += 1
+        if self.n < self.period:
+            self.window.append(x)
+            return NAN
+        if self.n == self.period:
+            self.window.append(x)
+            values = list(self.window)
+            self.fast_value = sum(values[-self.fast :]) / self.fast
+            self.slow_value = sum(values) / self.period
+            self.window.clear()
+        else:
+            self.fast_value = x * self.k_fast + self.fast_value * (1 - self.k_fast)
+            self.slow_value = x * self.k_slow + self.slow_value * (1 - self.k_slow)
+        if self.n < self.period + self.signal - 1:
+            return NAN
+        return self.fast_value - self.slow_value
+
+
+class RSI(StreamingIndicator):
+    children = {"gain": Wilder, "loss": Wilder}
+
+    def __init__(self, period=14):
+        self.period = period
+        self.previous = None
+        self.gain = Wilder(period)
+        self.loss = Wilder(period)
+
+    def update(self, x):
+        if self.previous is None:
+            self.previous = x
+            return NAN
+        change = x - self.previous
+        self.previous = x
+        average_gain = self.gain.update(max(change, 0.0))
+        average_loss = self.loss.update(max(-change, 0.0))
+        if math.isnan(average_gain):
+            return NAN
+        total = average_gain + average_loss
+        return 100 * average_gain / total if total > 0 else 0.0
+
+
+class BBands(StreamingIndicator):
+    """Upper, middle and lower band over a window of population standard deviations."""
+
+    buffers = ("window",)
+
+    def __init__(self, period=5, nbdev=2):
+        self.period = period
+        self.nbdev = nbdev
+        self.window = deque(maxlen=period)
+
+    def update(self, x):
+        self.window.append(x)
+        if len(self.window) < self.period:
+            return NAN, NAN, NAN
+        middle = sum(self.window) / self.period
+        deviation = self.nbdev * math.sqrt(
+            sum((value - middle) ** 2 for value in self.window) / self.period
+        )
+        return middle + deviation, middle, middle - deviation
+
+
+def true_range(high, low, previous_close):
+    return max(high, previous_close) - min(low, previous_close)
+
+
+class ATR(StreamingIndicator):
+    children = {"average": Wilder}
+
+    def __init__(self, period=14):
+        self.period = period
+        self.previous_close = None
+        self.average = Wilder(period)
+
+    def update(self, high, low, close):
+        if self.previous_close is None:
+            self.previous_close = close
+            return NAN
+        value = self.average.update(true_range(high, low, self.previous_close))
+        self.previous_close = close
+        return value
+
+
+class ADX(StreamingIndicator):
+    """
+    Average directional index with talib's smoothing: directional movements and true range are
+    summed over the first period - 1 bars, then smoothed as sum - sum / period + value, and the
+    index is the Wilder average of DX seeded with the mean of the first `period` values.
+    ADXR is the mean of the index and its value period - 1 bars earlier.
+    """
+
+    buffers = ("history",)
+
+    def __init__(self, period=14):
+        self.period = period
+        self.n = 0
+        self.previous = None
+        self.plus_dm = 0.0
+        self.minus_dm = 0.0
+        self.tr = 0.0
+        self.dx_total = 0.0
+        self.value = NAN
+        self.history = deque(maxlen=period)
+
+    def update(self, high, low, close):
+        if self.previous is None:
+            self.previous = (high, low, close)
+            return NAN, NAN
+        previous_high, previous_low, previous_close = self.previous
+        self.previous = (high, low, close)
+        self.n += 1
+
+        up, down = high - previous_high, previous_low - low
+        plus_dm = up if up > 0 and up > down else 0.0
+        minus_dm = down if down > 0 and down > up else 0.0
+        tr = true_range(high, low, previous_close)
+        p = self.period
+        if self.n < p:
+            self.plus_dm += plus_dm
+            self.minus_dm += minus_dm
+            self.tr += tr
+            return NAN, NAN
+        self.plus_dm += plus_dm - self.plus_dm / p
+        self.minus_dm += minus_dm - self.minus_dm / p
+        self.tr += tr - self.tr / p
+
+        dx = None
+        if self.tr != 0:
+            plus_di = 100 * self.plus_dm / self.tr
+            minus_di = 100 * self.minus_dm / self.tr
+            if plus_di + minus_di != 0:
+                dx = 100 * abs(minus_di - plus_di) / (plus_di + minus_di)
+        if self.n < 2 * p:
+            self.dx_total += dx or 0.0
+            if self.n < 2 * p - 1:
+                return NAN, NAN
+            self.value = self.dx_total / p
+        elif dx is not None:
+            self.value = (self.value * (p - 1) + dx) / p
+
+        self.history.append(self.value)
+        adxr = (self.value + self.history[0]) / 2 if len(self.history) == p else NAN
+        return self.value, adxr
+
+
+class AD(StreamingIndicator):
+
+    def __init__(self):
+        self.value = 0.0
+
+    def update(self, high, low, close, volume):
+        if high > low:
+            self.value += ((close - low) - (high - close)) / (high - low) * volume
+        return self.value
+
+
+INDICATOR_CLASSES = {
+    cls.__name__: cls for cls in (SMA, EMA, Wilder, MACD, RSI, BBands, ATR, ADX, AD)
+}
+
+
+class StreamingIndicators:
+    """
+    The indicators.DEFAULT_INDICATORS columns, bar by bar, except HT_DC whose Hilbert transform
+    is only computed in batch.
+    """
+
+    columns = ["MA5", "MA10", "MA20", "MA60", "MA120", "VMA5", "VMA10", "VMA20"] + [
+        "ADX",
+        "ADXR",
+        "MACD",
+        "RSI",
+        "BBANDS_U",
+        "BBANDS_M",
+        "BBANDS_L",
+        "AD",
+        "ATR",
+    ]
+
+    def __init__(self, indicators=None):
+        self.indicators = indicators or {
+            **{f"MA{p}": SMA(p) for p in (5, 10, 20, 60, 120)},
+            **{f"VMA{p}": SMA(p) for p in (5, 10, 20)},
+            "ADX": ADX(14),
+            "MACD": MACD(12, 26, 9),
+            "RSI": RSI(14),
+            "BBANDS": BBands(5, 2),
+            "AD": AD(),
+            "ATR": ATR(14),
+        }
+
+    def update(self, o, h, l, c, v):
+        x = self.indicators
+        row = [x[f"MA{p}"].update(c) for p in (5, 10, 20, 60, 120)]
+        row += [x[f"VMA{p}"].update(v) for p in (5, 10, 20)]
+        row += list(x["ADX"].update(h, l, c))
+        row += [x["MACD"].update(c), x["RSI"].update(c)]
+        row += list(x["BBANDS"].update(c))
+        row += [x["AD"].update(h, l, c, v), x["ATR"].update(h, l, c)]
+        return row
+
+    def update_frame(self, df):
+        """Feeds every bar of a frame with Open, High, Low, Close and Volume columns, returns their indicators."""
+        bars = df[["Open", "High", "Low", "Close", "Volume"]].astype(float).values
+        rows = [self.update(*bar) for bar in bars.tolist()]
+        return pd.DataFrame(
+            np.array(rows, dtype=float).reshape(len(rows), len(self.columns)),
+            index=df.index,
+            columns=self.columns,
+        )
+
+    def state(self):
+        return {
+            name: [type(indicator).__name__, indicator.state()]
+            for name, indicator in self.indicators.items()
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        return cls(
+            {
+                name: INDICATOR_CLASSES[kind].from_state(values)
+                for name, (kind, values) in state.items()
+            }
+        )
+
+
+class IndicatorCheckpoints:
+    """Indicator state of every symbol along with the date of the last bar it has seen."""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS indicator_state (
+                symbol TEXT PRIMARY KEY,
+                last_date TEXT NOT NULL,
+                state TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def load(self, symbol):
+        row = self._conn.execute(
+            "SELECT last_date, state FROM indicator_state WHERE symbol = ?", (symbol,)
+        ).fetchone()
+        if row is None:
+            return None, StreamingIndicators()
+        return pd.Timestamp(row[0]), StreamingIndicators.from_state(json.loads(row[1]))
+
+    def reset(self, symbol):
+        """Forget the state of `symbol`, e.g. once its stored history was rewritten."""
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM indicator_state WHERE symbol = ?", (symbol,)
+            )
+
+    def last_date(self, symbol):
+        row = self._conn.execute(
+            "SELECT last_date FROM indicator_state WHERE symbol = ?", (symbol,)
+        ).fetchone()
+        return None if row is None else pd.Timestamp(row[0])
+
+    def save(self, symbol, last_date, indicators):
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO indicator_state VALUES (?, ?, ?)",
+                (
+                    symbol,
+                    pd.Timestamp(last_date).isoformat(),
+                    json.dumps(indicators.state()),
+                ),
+            )
+
+    def update(self, symbol, bars):
+        """
+        Feeds only the bars (with a Date column) newer than the checkpoint of `symbol`,
+        saves the new state and returns the indicators of those bars.
+        """
+        last_date, indicators = self.load(symbol)
+        dates = pd.to_datetime(bars["Date"])
+        if last_date is not None:
+            bars = bars[dates > last_date]
+            dates = dates[dates > last_date]
+        if bars.empty:
+            return pd.DataFrame(columns=["Date"] + StreamingIndicators.columns)
+        values = indicators.update_frame(bars)
+        values.insert(0, "Date", dates.values)
+        self.save(symbol, dates.max(), indicators)
+        return values
+
+    def catch_up(self, symbol, store):
+        """
+        Brings the checkpoint of `symbol` up to the last bar of the price store: only the bars
+        after the checkpoint are read and fed (all of them when there is no checkpoint yet).
+        Returns the indicators of those bars.
+        """
+        return self.update(symbol, store.read(symbol, start=self.last_date(symbol)))
@@ -0,0 +1,144 @@
+import multiprocessing
+import os
+import time
+import traceback
+from asyncio.log import logger
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+from threadpoolctl import threadpool_limits
+
+"""
+Runs a per-ticker training function (run_forest.train_ticker) over a list of tickers in worker processes.
+
+Each worker caps the BLAS / OpenMP thread pools, and passes n_jobs to XGBoost / LightGBM, so the
+workers together do not use more threads than there are cores. The summary csv file is updated as soon as a ticker finishes,
+and a ticker that raises only gets an error row, the other tickers carry on.
+"""
+
+# only read by libraries loaded after the initializer, and passed on to any process a worker starts
+THREAD_VARIABLES = [
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+]
+
+
+def pin_threads(n_threads):
+    for variable in THREAD_VARIABLES:
+        os.environ[variable] = str(n_threads)
+    # spawned workers import the parent's __main__ (numpy, xgboost, lightgbm) before the initializer
+    # runs, so their BLAS and OpenMP pools already read the variables above: cap them directly
+    threadpool_limits(limits=n_threads)
+    # workers only save figures
+    os.environ["MPLBACKEND"] = "Agg"
+
+
+def run_ticker(train, ticker, n_threads, params):
+    """
+    Calls train(ticker, n_jobs=n_threads, **params) and returns its rows (train returns one row,
+    or a list of them), failures come back as an error row.
+    """
+    started = time.perf_counter()
+    try:
+        rows = train(ticker, n_jobs=n_threads, **params)
+        rows = [rows] if isinstance(rows, dict) else list(rows)
+        for row in rows:
+            row["error"] = None
+    except Exception as e:
+        rows = [{"symbol": ticker, "error": f"{e!r}\n{traceback.format_exc()}"}]
+    for row in rows:
+        row["seconds"] = round(time.perf_counter() - started, 2)
+    return rows
+
+
+class ParallelTrainer:
+    """
+    Parameters
+    --------
+        train : callable
+            Module level function (it is sent to the worker processes) taking a ticker and
+            n_jobs, returning the summary row of the ticker as a dict (or a list of rows)
+        n_workers : int
+            Number of worker processes, 1 trains in the current process
+        threads_per_worker : int
+            Threads each worker lets XGBoost and LightGBM use, by default the cores split evenly
+        summary_path : str
+            csv file holding the summary rows, rewritten as each ticker finishes, None keeps them in memory only
+        params :
+            Other keywords of `train`
+    """
+
+    def __init__(
+        self, train, n_workers=1, threads_per_worker=None, summary_path=None, **params
+    ):
+        self.train = train
+        self.n_workers = max(1, n_workers)
+        self.threads_per_worker = threads_per_worker or max(
+            1, (os.cpu_count() or 1) // self.n_workers
+        )
+        self.summary_path = summary_path
+        self.params = params
+
+    def _record(self, ticker_rows, rows):
+        rows.extend(ticker_rows)
+        row = ticker_rows[0]
+        if row["error"] is None:
+            print(f"{row['symbol']} ... done in {row['seconds']}s")
+        else:
+            print(f"{row['symbol']} ... failed", row["error"].splitlines()[0])
+        if self.summary_path is not None:
+            # rewritten as a whole, error rows do not have the columns of the other rows
+            pd.DataFrame(rows).to_csv(self.summary_path + ".tmp", index=False)
+            os.replace(self.summary_path + ".tmp", self.summary_path)
+
+    def run(self, tickers):
+        rows = []
+
+        logger.info(
+            f"training {len(tickers)} tickers on {self.n_workers} workers "
+            f"x {self.threads_per_worker} threads"
+        )
+        if self.n_workers == 1:
+            for ticker in tickers:
+                self._record(
+                    run_ticker(
+                        self.train, ticker, self.threads_per_worker, self.params
+                    ),
+                    rows,
+                )
+        else:
+            # xgboost and lightgbm thread pools do not survive a fork
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(
+                self.n_workers,
+                mp_context=context,
+                initializer=pin_threads,
+                initargs=(self.threads_per_worker,),
+            ) as executor:
+                futures = {
+                    executor.submit(
+                        run_ticker,
+                        self.train,
+                        ticker,
+                        self.threads_per_worker,
+                        self.params,
+                    ): ticker
+                    for ticker in tickers
+                }
+                for future in as_completed(futures):
+                    try:
+                        ticker_rows = future.result()
+                    except Exception as e:
+                        # the worker itself died, e.g. killed or out of memory
+                        ticker_rows = [
+                            {
+                                "symbol": futures[future],
+                                "error": repr(e),
+                                "seconds": None,
+                            }
+                        ]
+                    self._record(ticker_rows, rows)
+
+        return pd.DataFrame(rows)
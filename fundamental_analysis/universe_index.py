@@ -0,0 +1,139 @@
+import sqlite3
+import threading
+from asyncio.log import logger
+from datetime import datetime, timedelta
+
+from scanner import TokenBucket, exchange_of
+
+"""
+Persisted record of which ticker codes resolve to a real listing.
+
+The vaid_* generators enumerate every code of a numeric range and most of them are not listed.
+Every probed code is recorded here with its status and when it was last checked:
+    live     : the code returned financial statements
+    dead     : the code never returned anything
+    delisted : the code used to be live and stopped returning anything
+Scans only go through live and never seen codes, dead and delisted ones are re-probed in the
+background once they have not been checked for `reprobe_days`.
+"""
+
+LIVE = "live"
+DEAD = "dead"
+DELISTED = "delisted"
+
+
+class UniverseIndex:
+
+    def __init__(self, path, reprobe_days=30):
+        self.path = path
+        self.reprobe_after = timedelta(days=reprobe_days)
+        self._lock = threading.Lock()
+        # the screen shard processes record into the same file
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS universe (
+                ticker TEXT PRIMARY KEY,
+                exchange TEXT NOT NULL,
+                status TEXT NOT NULL,
+                first_listed TEXT,
+                last_checked TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def status(self, ticker):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status FROM universe WHERE ticker = ?", (ticker,)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def record(self, ticker, listed):
+        now = datetime.now().isoformat()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT status, first_listed FROM universe WHERE ticker = ?", (ticker,)
+            ).fetchone()
+            previous, first_listed = row if row is not None else (None, None)
+            if listed:
+                status = LIVE
+                first_listed = first_listed or now
+            elif previous in (LIVE, DELISTED):
+                status = DELISTED
+            else:
+                status = DEAD
+            self._conn.execute(
+                "INSERT OR REPLACE INTO universe VALUES (?, ?, ?, ?, ?)",
+                (ticker, exchange_of(ticker), status, first_listed, now),
+            )
+        if previous == LIVE and status == DELISTED:
+            logger.info(f"{ticker} looks delisted")
+
+    def _not_live(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT ticker, last_checked FROM universe WHERE status != ?", (LIVE,)
+            ).fetchall()
+        return {ticker: datetime.fromisoformat(checked) for ticker, checked in rows}
+
+    def filter(self, tickers):
+        """Skip the codes known to be dead or delisted, yield live and never seen ones."""
+        skip = self._not_live()
+        n_skipped = 0
+        for ticker in tickers:
+            if ticker in skip:
+                n_skipped += 1
+                continue
+            yield ticker
+        logger.info(f"skipped {n_skipped} dead or delisted codes")
+
+    def due_for_reprobe(self, now=None):
+        now = now or datetime.now()
+        return sorted(
+            ticker
+            for ticker, checked in self._not_live().items()
+            if now - checked > self.reprobe_after
+        )
+
+    def reprobe(self, probe, rate=0.2, stop=None):
+        """
+        Call `probe(ticker) -> bool` on every dead or delisted code that is due, at most `rate`
+        calls per second, and record the outcome. Probe errors leave the code untouched.
+        """
+        bucket = TokenBucket(rate, 1)
+        n_revived = 0
+        for ticker in self.due_for_reprobe():
+            if stop is not None and stop.is_set():
+                break
+            bucket.acquire()
+            try:
+                listed = probe(ticker)
+            except Exception as e:
+                logger.info(f"re-probe of {ticker} failed: {e}")
+                continue
+            self.record(ticker, listed)
+            n_revived += bool(listed)
+        logger.info(f"re-probe found {n_revived} new listings")
+        return n_revived
+
+    def start_background_reprobe(self, probe, rate=0.2, interval_seconds=3600):
+        """
+        Re-probe due codes on a daemon thread every `interval_seconds`.
+        Returns the threading.Event that stops it.
+        """
+        stop = threading.Event()
+
+        def run():
+            while not stop.is_set():
+                self.reprobe(probe, rate=rate, stop=stop)
+                stop.wait(interval_seconds)
+
+        threading.Thread(target=run, name="universe-reprobe", daemon=True).start()
+        return stop
@@ -1,11 +1,13 @@
+import time
 from asyncio.log import logger
 
 import sqlalchemy
 import yfinance as yf
 import numpy as np
-import pandas_ta as pandas_ta
 import pandas as pd
-import talib as tb
+
+from features import compute_features
+from indicators import compute_indicators
 
 """
 Hong Kong, Shenzhen, Shanghai stocks used number + exch appendix (e.g. HK, SZ, SS)
@@ -47,10 +49,40 @@ def sp_500_generator():
         yield t
 
 
-def get_data(tickers):
+def download_batches(tickers, batch_size=20, start=None):
+    """
+    Daily bars of `tickers` downloaded with one multi-ticker yahoo request per batch.
+    Yields (ticker, frame) as soon as the batch holding the ticker is complete, frame is None when
+    yahoo returned nothing for the symbol. Frames have the same layout as yf.download(ticker).reset_index().
+    Only bars from `start` on are downloaded when it is given.
+    """
+    tickers = list(tickers)
+    for i in range(0, len(tickers), batch_size):
+        batch = tickers[i : i + batch_size]
+        data = yf.download(
+            batch, start=start, group_by="ticker", threads=True, progress=False
+        )
+        downloaded = set(data.columns.get_level_values(0)) if not data.empty else set()
+        for ticker in batch:
+            if ticker not in downloaded:
+                yield ticker, None
+                continue
+            frame = data[ticker].dropna(how="all")
+            if frame.empty:
+                yield ticker, None
+                continue
+            frame = frame[sorted(frame.columns)]
+            frame.columns.name = None
+            yield ticker, frame.reset_index()
+
+
+def get_data(tickers, batch_size=20):
     data = []
-    for ticker in tickers:
-        data.append((ticker, yf.download(ticker).reset_index()))
+    for ticker, frame in download_batches(tickers, batch_size):
+        if frame is None:
+            logger.info(f"no data downloaded for {ticker}")
+            continue
+        data.append((ticker, frame))
     return data
 
 
@@ -60,17 +92,126 @@ def create_engine(name):
 
 
 def TOSQL(frames, engine):
+    connection = engine.raw_connection()
     for symbol, frame in frames:
-        frame.to_sql(symbol, engine.raw_connection(), index=False, if_exists="replace")
+        frame.to_sql(symbol, connection, index=False, if_exists="replace")
+    connection.close()
     logger.info("imported successfully")
 
 
-def check_pandas(df: pd.DataFrame):
-    logger.info("Process started for function: get_return..")
-    if df.empty:
-        logger.debug("The dataframe is empty. No transformations will be applied.")
-        return df
-    logger.info("Applying transformations to pd")
+def bulk_ingest(tickers, store, batch_size=20):
+    """
+    Download `tickers` in batches and write each frame to the PriceStore as soon as it arrives,
+    so nothing but the current batch is held in memory.
+    Returns a report with the number of symbols and rows stored, the failed symbols and the throughput.
+    """
+    started = time.perf_counter()
+    n_symbols, n_rows, failed = 0, 0, []
+    for ticker, frame in download_batches(tickers, batch_size):
+        if frame is None:
+            failed.append(ticker)
+            continue
+        n_rows += store.write(ticker, frame, replace=True)
+        n_symbols += 1
+    seconds = time.perf_counter() - started
+    report = {
+        "symbols": n_symbols,
+        "rows": n_rows,
+        "failed": failed,
+        "seconds": round(seconds, 2),
+        "symbols_per_second": round(n_symbols / seconds, 2) if seconds else None,
+    }
+    logger.info(f"bulk ingest: {report}")
+    return report
+
+
+def adjusted_close_drift(stored, downloaded):
+    """
+    Largest relative difference of the adjusted close between the stored bars and a fresh download
+    over the dates they share. Yahoo rewrites the whole adjusted history after a split or a dividend,
+    so any drift means the stored history is stale.
+    """
+    price = "Adj Close" if "Adj Close" in downloaded.columns else "Close"
+    stored = stored.set_index("Date")[price]
+    downloaded = downloaded.set_index("Date")[price]
+    shared = stored.index.intersection(downloaded.index)
+    if shared.empty:
+        return 0.0
+    old, new = stored.loc[shared].astype(float), downloaded.loc[shared].astype(float)
+    return float(((new - old).abs() / old.abs()).max())
+
+
+def refresh_prices(
+    tickers, store, batch_size=20, overlap_days=10, tolerance=1e-4, checkpoints=None
+):
+    """
+    Incremental version of bulk_ingest: for symbols already stored only the bars after the last
+    stored date are downloaded and appended. The download starts `overlap_days` before that date so
+    the overlapping bars can be compared with what is stored; a symbol whose adjusted close drifted by
+    more than `tolerance` (a split or dividend restated its history) is downloaded again in full and
+    its history rewritten. Symbols not stored yet get their full history.
+    With streaming_indicators.IndicatorCheckpoints `checkpoints`, the indicators of every symbol are
+    then advanced over its new bars only (from scratch when its history was rewritten), the report's
+    "indicators" holding the latest indicator values of each symbol.
+    """
+    started = time.perf_counter()
+    stored_last_dates = store.last_dates()
+    last_dates = {ticker: stored_last_dates.get(ticker) for ticker in tickers}
+    new_symbols = [ticker for ticker, last in last_dates.items() if last is None]
+    stored_symbols = sorted(
+        (ticker for ticker, last in last_dates.items() if last is not None),
+        key=lambda ticker: last_dates[ticker],
+    )
+
+    n_appended, up_to_date, restated, failed = 0, [], [], []
+    # symbols sorted by last date so a batch shares roughly the same download window
+    for i in range(0, len(stored_symbols), batch_size):
+        batch = stored_symbols[i : i + batch_size]
+        start = min(last_dates[ticker] for ticker in batch) - pd.Timedelta(
+            days=overlap_days
+        )
+        for ticker, frame in download_batches(batch, len(batch), start=start):
+            if frame is None:
+                failed.append(ticker)
+                continue
+            stored = store.read(ticker, start=start)
+            if adjusted_close_drift(stored, frame) > tolerance:
+                restated.append(ticker)
+                continue
+            new_bars = frame[frame["Date"] > last_dates[ticker]]
+            if new_bars.empty:
+                up_to_date.append(ticker)
+                continue
+            n_appended += store.write(ticker, new_bars)
+
+    for ticker, frame in download_batches(new_symbols + restated, batch_size):
+        if frame is None:
+            failed.append(ticker)
+            continue
+        store.write(ticker, frame, replace=True)
+
+    latest = {}
+    if checkpoints is not None:
+        for ticker in tickers:
+            if ticker in failed:
+                continue
+            if ticker in new_symbols or ticker in restated:
+                checkpoints.reset(ticker)
+            values = checkpoints.catch_up(ticker, store)
+            if not values.empty:
+                latest[ticker] = values.iloc[-1]
+
+    report = {
+        "appended_rows": n_appended,
+        "up_to_date": up_to_date,
+        "new": [ticker for ticker in new_symbols if ticker not in failed],
+        "restated": [ticker for ticker in restated if ticker not in failed],
+        "failed": failed,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+    logger.info(f"price refresh: {report}")
+    report["indicators"] = pd.DataFrame(latest).T
+    return report
 
 
 def get_return(df: pd.DataFrame):
@@ -80,11 +221,7 @@ def get_return(df: pd.DataFrame):
     :returns:
     data_frame: Transformed Pandas DataFrame as Output
     """
-    check_pandas(df)
-    # also could just be df["Adj Close"].pct_change()
-    df["Return"] = round(df["Adj Close"] / df["Adj Close"].shift(1) - 1, 4)
-    logger.info("Process completed for function: get_return..")
-    return df
+    return compute_features(df, ["Return"])
 
 
 def get_state(df: pd.DataFrame):
@@ -94,9 +231,7 @@ def get_state(df: pd.DataFrame):
     :returns:
     data_frame: Transformed Pandas DataFrame as Output
     """
-    check_pandas(df)
-    df["state"] = np.where(df["Return"] > 0, "1", "0")
-    return df
+    return compute_features(df, ["state"])
 
 
 def get_garman_klass_vol(df):
@@ -106,12 +241,7 @@ def get_garman_klass_vol(df):
     :returns:
     data_frame: Transformed Pandas DataFrame as Output
     """
-    check_pandas(df)
-    df["garman_klass_vol"] = ((np.log(df["High"]) - np.log(df["Low"])) ** 2) / 2 - (
-        2 * np.log(2) - 1
-    ) * ((np.log(df["Adj Close"]) - np.log(df["Open"])) ** 2)
-    logger.info("Process completed for function: get_garman_klass_vol..")
-    return df
+    return compute_features(df, ["garman_klass_vol"])
 
 
 def get_rsi(df):
@@ -121,10 +251,7 @@ def get_rsi(df):
     :returns:
     data_frame: Transformed Pandas DataFrame as Output
     """
-    check_pandas(df)
-    df["rsi"] = df["Adj Close"].transform(lambda x: pandas_ta.rsi(close=x, length=20))
-    logger.info("Process completed for function: get_rsi..")
-    return df
+    return compute_features(df, ["rsi"])
 
 
 def get_bb_low(df):
@@ -134,13 +261,7 @@ def get_bb_low(df):
     :returns:
     data_frame: Transformed Pandas DataFrame as Output
     """
-    check_pandas(df)
-    df["bb_low"] = df["Adj Close"].transform(
-        lambda x: pandas_ta.bbands(close=np.log1p(x), length=20).iloc[:, 0]
-    )
-    # normalize the value by dividing it against adjust close price)
-    df["bb_low"] = df["bb_low"] / df["Adj Close"]
-    return df
+    return compute_features(df, ["bb_low"])
 
 
 def get_bb_mid(df):
@@ -150,13 +271,7 @@ def get_bb_mid(df):
     :returns:
     data_frame: Transformed Pandas DataFrame as Output
     """
-    check_pandas(df)
-    df["bb_mid"] = df["Adj Close"].transform(
-        lambda x: pandas_ta.bbands(close=np.log1p(x), length=20).iloc[:, 1]
-    )
-    # normalize the value by dividing it against adjust close price)
-    df["bb_mid"] = df["bb_mid"] / df["Adj Close"]
-    return df
+    return compute_features(df, ["bb_mid"])
 
 
 def get_bb_high(df):
@@ -166,23 +281,7 @@ def get_bb_high(df):
     :returns:
     data_frame: Transformed Pandas DataFrame as Output
     """
-    check_pandas(df)
-    df["bb_high"] = df["Adj Close"].transform(
-        lambda x: pandas_ta.bbands(close=np.log1p(x), length=20).iloc[:, 2]
-    )
-    # normalize the value by dividing it against adjust close price)
-    df["bb_high"] = df["bb_high"] / df["Adj Close"]
-    return df
-
-
-def compute_atr(stock_data):
-    atr = pandas_ta.atr(
-        high=stock_data["High"],
-        low=stock_data["Low"],
-        close=stock_data["Close"],
-        length=14,
-    )
-    return atr.sub(atr.mean()).div(atr.std())
+    return compute_features(df, ["bb_high"])
 
 
 def get_atr(df):
@@ -192,20 +291,7 @@ def get_atr(df):
     :returns:
     data_frame: Transformed Pandas DataFrame as Output
     """
-    check_pandas(df)
-    df["atr"] = df.apply(compute_atr)
-    return df
-
-
-def compute_macd(close):
-    """
-    :param data_frame: Pandas DataFrame as Input
-
-    :returns:
-    data_frame: Transformed Pandas DataFrame as Output
-    """
-    macd = pandas_ta.macd(close=close, length=20).iloc[:, 0]
-    return macd.sub(macd.mean()).div(macd.std())
+    return compute_features(df, ["atr"])
 
 
 def get_macd(df):
@@ -215,8 +301,7 @@ def get_macd(df):
     :returns:
     data_frame: Transformed Pandas DataFrame as Output
     """
-    df["macd"] = df["Adj Close"].apply(compute_macd)
-    return df
+    return compute_features(df, ["macd"])
 
 
 def get_dollar_volume(df):
@@ -226,38 +311,20 @@ def get_dollar_volume(df):
     :returns:
     data_frame: Transformed Pandas DataFrame as Output
     """
-    df["dollar_volume"] = (df["Adj Close"] * df["Volume"]) / 1e6
-    return df
+    return compute_features(df, ["dollar_volume"])
 
 
 def get_technical_analysis_features(df, ticker):
     """
-    use talib to get tech indicators directory
+    use talib to get tech indicators directory, through the single pass engine of indicators.py
     """
-    o = df["Open"].values
-    c = df["Close"].values
-    h = df["High"].values
-    l = df["Low"].values
-    v = df["Volume"].astype(float).values
-    # define the technical analysis matrix
-
-    df["MA5"] = tb.MA(c, timeperiod=5)
-    df["MA10"] = tb.MA(c, timeperiod=10)
-    df["MA20"] = tb.MA(c, timeperiod=20)
-    df["MA60"] = tb.MA(c, timeperiod=60)
-    df["MA120"] = tb.MA(c, timeperiod=120)
-    df["MA5"] = tb.MA(v, timeperiod=5)
-    df["MA10"] = tb.MA(v, timeperiod=10)
-    df["MA20"] = tb.MA(v, timeperiod=20)
-    df["ADX"] = tb.ADX(h, l, c, timeperiod=14)
-    df["ADXR"] = tb.ADXR(h, l, c, timeperiod=14)
-    df["MACD"] = tb.MACD(c, fastperiod=12, slowperiod=26, signalperiod=9)[0]
-    df["RSI"] = tb.RSI(c, timeperiod=14)
-    df["BBANDS_U"] = tb.BBANDS(c, timeperiod=5, nbdevup=2, nbdevdn=2, matype=0)[0]
-    df["BBANDS_M"] = tb.BBANDS(c, timeperiod=5, nbdevup=2, nbdevdn=2, matype=0)[1]
-    df["BBANDS_L"] = tb.BBANDS(c, timeperiod=5, nbdevup=2, nbdevdn=2, matype=0)[2]
-    df["AD"] = tb.AD(h, l, c, v)
-    df["ATR"] = tb.ATR(h, l, c, timeperiod=14)
-    df["HT_DC"] = tb.HT_DCPERIOD(c)
+    matrix, names = compute_indicators(
+        df["Open"].values,
+        df["High"].values,
+        df["Low"].values,
+        df["Close"].values,
+        df["Volume"].astype(float).values,
+    )
+    df[names] = matrix
 
     return df
@@ -0,0 +1,213 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from xgboost import XGBClassifier
+
+from config import WF_COST_BPS, WF_EMBARGO_BARS, WF_FOLD_WORKERS, WF_LONG_THRESHOLD
+from config import WF_PURGE_BARS, WF_SHORT_THRESHOLD, WF_SUMMARY, WF_TEST_BARS
+from config import WF_TRAIN_BARS, WF_WINDOW, WF_WORKERS, WF_XGB_PARAMS
+from config import TRAIN_THREADS_PER_WORKER
+from feature_cache import FeatureCache
+from run_forest import Data, target_list
+from training_driver import ParallelTrainer
+
+"""
+Walk-forward backtest of XGBoost direction forecasts.
+
+Every fold trains on the bars before its test window only: all of them ("expanding") or the last
+`train_bars` ("rolling"). The `purge` bars before the test window are dropped from training because
+their labels look into it, then `embargo` more bars, whose features overlap the test window's.
+Folds are trained concurrently by threads.
+
+The model of a fold predicts whether the next bar closes up from the features of Data.feature_matrix
+(no feature selection, it would have looked at the test labels). The positions taken from the
+predicted probabilities, their turnover, costs and returns are then computed for every fold at once.
+"""
+
+ANNUAL_BARS = 252
+
+
+def walk_forward_splits(
+    n,
+    train_bars=WF_TRAIN_BARS,
+    test_bars=WF_TEST_BARS,
+    window=WF_WINDOW,
+    purge=WF_PURGE_BARS,
+    embargo=WF_EMBARGO_BARS,
+):
+    """(train start, train end, test start, test end) of the folds over n bars, ends excluded."""
+    if window not in ("expanding", "rolling"):
+        raise ValueError('window must be either "expanding" or "rolling"')
+    gap = purge + embargo
+    splits = []
+    for test_start in range(train_bars + gap, n, test_bars):
+        train_end = test_start - gap
+        train_start = 0 if window == "expanding" else train_end - train_bars
+        splits.append(
+            (train_start, train_end, test_start, min(test_start + test_bars, n))
+        )
+    return splits
+
+
+def positions(
+    probabilities, long_threshold=WF_LONG_THRESHOLD, short_threshold=WF_SHORT_THRESHOLD
+):
+    """1 above `long_threshold`, -1 below `short_threshold` (when given), 0 otherwise."""
+    position = (probabilities > long_threshold).astype(float)
+    if short_threshold is not None:
+        position[probabilities < short_threshold] = -1.0
+    return position
+
+
+def strategy_returns(position, asset_returns, fold, cost_bps=WF_COST_BPS):
+    """
+    Returns net of costs and turnover of holding `position` over the next bar's `asset_returns`.
+    Positions start flat at the beginning of each fold.
+    """
+    previous = np.concatenate([[0.0], position[:-1]])
+    previous[np.flatnonzero(np.diff(fold, prepend=-1) != 0)] = 0.0
+    turnover = np.abs(position - previous)
+    return position * asset_returns - turnover * cost_bps / 1e4, turnover
+
+
+def sharpe(returns):
+    std = returns.std()
+    return np.sqrt(ANNUAL_BARS) * returns.mean() / std if std > 0 else np.nan
+
+
+class WalkForward:
+    """
+    Parameters
+    --------
+        params : dict
+            XGBClassifier parameters of every fold
+        n_workers : int
+            Folds trained at the same time
+        n_jobs : int
+            Total XGBoost threads, split between the workers. None leaves it to XGBoost
+        cost_bps : float
+            Cost of trading one unit of position, in basis points
+        split_params :
+            Keywords of `walk_forward_splits`
+    """
+
+    def __init__(
+        self,
+        params=WF_XGB_PARAMS,
+        n_workers=WF_FOLD_WORKERS,
+        n_jobs=None,
+        cost_bps=WF_COST_BPS,
+        long_threshold=WF_LONG_THRESHOLD,
+        short_threshold=WF_SHORT_THRESHOLD,
+        **split_params,
+    ):
+        self.params = params
+        self.n_workers = max(1, n_workers)
+        self.n_jobs = n_jobs
+        self.cost_bps = cost_bps
+        self.long_threshold = long_threshold
+        self.short_threshold = short_threshold
+        self.split_params = split_params
+
+    def _fit_predict(self, X, y, split):
+        train_start, train_end, test_start, test_end = split
+        threads = None if self.n_jobs is None else max(1, self.n_jobs // self.n_workers)
+        model = XGBClassifier(tree_method="hist", n_jobs=threads, **self.params)
+        model.fit(X[train_start:train_end], y[train_start:train_end])
+        return model.predict_proba(X[test_start:test_end])[:, 1]
+
+    def run(self, X, asset_returns):
+        """
+        Out of sample predictions and strategy returns of every bar of every fold.
+        `asset_returns` holds the return of the bar after each row of X, which is also the label.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        asset_returns = np.asarray(asset_returns, dtype=np.float64)
+        y = (asset_returns > 0).astype(int)
+        splits = walk_forward_splits(len(y), **self.split_params)
+        if not splits:
+            raise ValueError(
+                f"{len(y)} bars are too few for a single walk-forward fold"
+            )
+        with ThreadPoolExecutor(self.n_workers) as executor:
+            probabilities = list(
+                executor.map(lambda split: self._fit_predict(X, y, split), splits)
+            )
+
+        rows = np.concatenate([np.arange(start, end) for _, _, start, end in splits])
+        fold = np.concatenate(
+            [np.full(end - start, k) for k, (_, _, start, end) in enumerate(splits)]
+        )
+        probability = np.concatenate(probabilities)
+        position = positions(probability, self.long_threshold, self.short_threshold)
+        net, turnover = strategy_returns(
+            position, asset_returns[rows], fold, self.cost_bps
+        )
+        return pd.DataFrame(
+            {
+                "fold": fold,
+                "row": rows,
+                "probability": probability,
+                "label": y[rows],
+                "position": position,
+                "asset_return": asset_returns[rows],
+                "turnover": turnover,
+                "strategy_return": net,
+            }
+        )
+
+    @staticmethod
+    def report(bars):
+        """Accuracy, Sharpe ratio and turnover of every fold of `bars` (as returned by run), then of all of them."""
+
+        def metrics(group):
+            return pd.Series(
+                {
+                    "n_bars": len(group),
+                    "accuracy": ((group["probability"] > 0.5) == group["label"]).mean(),
+                    "sharpe": sharpe(group["strategy_return"]),
+                    "buy_hold_sharpe": sharpe(group["asset_return"]),
+                    "turnover": group["turnover"].mean(),
+                    "total_return": np.prod(1 + group["strategy_return"]) - 1,
+                }
+            )
+
+        folds = bars.groupby("fold").apply(metrics, include_groups=False)
+        folds.loc["all"] = metrics(bars)
+        return folds
+
+
+def backtest_ticker(symbol, store=None, feature_cache=None, n_jobs=None, **params):
+    """Per fold rows (then the "all" row) of the walk-forward backtest of one ticker."""
+    data = Data(symbol, store=store, feature_cache=feature_cache)
+    data.feature_matrix(seq_length=3)
+    close = data.daily_data["Close"]
+    # features of the close of bar t, return from that close to the next one
+    next_return = (close.shift(-1) / close - 1).values[:-1]
+    engine = WalkForward(n_jobs=n_jobs, **params)
+    report = engine.report(engine.run(data.X.values[:-1], next_return))
+    report.insert(0, "fold", report.index.astype(str))
+    report.insert(0, "symbol", symbol)
+    return report.to_dict("records")
+
+
+def main(n_workers=WF_WORKERS, tickers=target_list):
+    """Walk-forward backtest of every ticker of the target list."""
+    trainer = ParallelTrainer(
+        backtest_ticker,
+        n_workers=n_workers,
+        threads_per_worker=TRAIN_THREADS_PER_WORKER,
+        summary_path=WF_SUMMARY,
+        feature_cache=FeatureCache(),
+    )
+    summary = trainer.run(tickers)
+    print("\n")
+    if "fold" in summary:
+        print(summary[summary["fold"] == "all"].to_string())
+    print(f"\nPer fold results are saved to {os.path.abspath(WF_SUMMARY)}")
+
+
+if __name__ == "__main__":
+    main()